@@ -0,0 +1,65 @@
+"""Benchmark of the startup time of pixyz.
+
+This script measures
+
+* the wall time of `python -c "import pixyz"` (and of importing all subpackages), and
+* the time to construct many small distributions.
+
+Each import is measured in a fresh interpreter. Run it from the root of the repository:
+
+    $ python benchmarks/import_time.py
+
+"""
+import argparse
+import os
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+IMPORT_STATEMENTS = {
+    "torch": "import torch",
+    "pixyz": "import pixyz",
+    "pixyz (all)": "import pixyz.distributions, pixyz.losses, pixyz.models, pixyz.flows",
+}
+
+CONSTRUCTION_CODE = """
+import time
+import torch
+from pixyz.distributions import Normal
+t = time.perf_counter()
+for i in range({n}):
+    Normal(loc="x", scale=torch.tensor(1.), var=["z_%d" % i], cond_var=["x"], name="q_%d" % i)
+print(time.perf_counter() - t)
+"""
+
+
+def _run(code):
+    env = dict(os.environ)
+    env["PYTHONPATH"] = os.pathsep.join([ROOT, env.get("PYTHONPATH", "")])
+    start = time.perf_counter()
+    output = subprocess.check_output([sys.executable, "-c", code], env=env)
+    return time.perf_counter() - start, output
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark of the startup time of pixyz.")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--n-distributions", type=int, default=1000)
+    args = parser.parse_args()
+
+    for label, statement in IMPORT_STATEMENTS.items():
+        best = min(_run(statement)[0] for _ in range(args.repeat))
+        print("import {:<12}: {:8.1f} ms".format(label, best * 1e3))
+
+        statement += "\nimport sys; print(sorted(m for m in ('sympy', 'scipy', 'IPython') if m in sys.modules))"
+        print("{:<19} loaded: {}".format("", _run(statement)[1].decode().strip()))
+
+    best = min(float(_run(CONSTRUCTION_CODE.format(n=args.n_distributions))[1])
+               for _ in range(args.repeat))
+    print("construct {} distributions: {:8.1f} ms".format(args.n_distributions, best * 1e3))
+
+
+if __name__ == "__main__":
+    main()
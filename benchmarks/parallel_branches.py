@@ -0,0 +1,71 @@
+"""Benchmark of the concurrent evaluation of independent factors (see `pixyz.utils.set_parallel_branches`).
+
+This script measures the time of `get_log_prob` + `backward` + `sample` of a product
+p(x|z)p(y|z)p(w|z)p(z) with MLP decoders, evaluated sequentially and with a thread pool.
+Run it from the root of the repository on a machine with several cores:
+
+    $ python benchmarks/parallel_branches.py --workers 0 2 4
+
+"""
+import argparse
+import os
+import sys
+import time
+
+import torch
+from torch import nn
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from pixyz.distributions import Normal  # noqa: E402
+from pixyz.utils import set_parallel_branches  # noqa: E402
+
+
+class Decoder(Normal):
+    def __init__(self, var, z_dim, x_dim, hidden):
+        super().__init__(var=[var], cond_var=["z"], features_shape=[x_dim])
+        self.net = nn.Sequential(nn.Linear(z_dim, hidden), nn.ReLU(), nn.Linear(hidden, hidden), nn.ReLU())
+        self.loc = nn.Linear(hidden, x_dim)
+
+    def forward(self, z):
+        return {"loc": self.loc(self.net(z)), "scale": torch.ones(1)}
+
+
+def _measure(p, x_dict, batch_size, repeat):
+    def step():
+        p.zero_grad()
+        p.get_log_prob(x_dict).sum().backward()
+        p.sample(batch_n=batch_size)
+
+    for _ in range(3):
+        step()
+    start = time.perf_counter()
+    for _ in range(repeat):
+        step()
+    return (time.perf_counter() - start) / repeat
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark of the concurrent evaluation of factors.")
+    parser.add_argument("--workers", type=int, nargs="+", default=[0, 2, 4])
+    parser.add_argument("--batch-size", type=int, default=32)
+    parser.add_argument("--hidden", type=int, default=512)
+    parser.add_argument("--repeat", type=int, default=50)
+    args = parser.parse_args()
+
+    z_dim, x_dim = 64, 784
+    p_z = Normal(loc=torch.tensor(0.), scale=torch.tensor(1.), var=["z"], features_shape=[z_dim])
+    p = Decoder("x", z_dim, x_dim, args.hidden) * Decoder("y", z_dim, x_dim, args.hidden) * \
+        Decoder("w", z_dim, x_dim, args.hidden) * p_z
+    x_dict = {var: torch.randn(args.batch_size, z_dim if var == "z" else x_dim) for var in ["x", "y", "w", "z"]}
+
+    print("cores: {}, intra-op threads: {}".format(os.cpu_count(), torch.get_num_threads()))
+    for n_workers in args.workers:
+        set_parallel_branches(n_workers)
+        elapsed = _measure(p, x_dict, args.batch_size, args.repeat)
+        print("workers {:<2}: {:8.2f} ms".format(n_workers, elapsed * 1e3))
+    set_parallel_branches(0)
+
+
+if __name__ == "__main__":
+    main()
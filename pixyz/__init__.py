@@ -1,2 +1,9 @@
+from .utils import cache_scope, SampleDict
+
 name = "pixyz"
 __version__ = "0.1.4"
+
+__all__ = [
+    'cache_scope',
+    'SampleDict',
+]
@@ -1,11 +1,13 @@
 from __future__ import print_function
+import functools
 import torch
 import re
 from torch import nn
 from copy import deepcopy
 
 from ..utils import get_dict_values, replace_dict_keys, replace_dict_keys_split, delete_dict_values,\
-    tolist, sum_samples, convert_latex_name
+    tolist, sum_samples, convert_latex_name, get_cache_scope, SampleDict, validate_args, parallel_branches,\
+    map_branches
 from ..losses import LogProb, Prob
 
 
@@ -92,7 +94,9 @@ class Distribution(nn.Module):
         self._var = var
 
         self._features_shape = torch.Size(features_shape)
-        self._name = convert_latex_name(name)
+        # the latex form of the name is computed lazily in :attr:`name`.
+        self._name = name
+        self._latex_name = None
 
         self._prob_text = None
         self._prob_factorized_text = None
@@ -105,12 +109,15 @@ class Distribution(nn.Module):
     @property
     def name(self):
         """str: Name of this distribution displayed in :obj:`prob_text` and :obj:`prob_factorized_text`."""
-        return self._name
+        if self._latex_name is None:
+            self._latex_name = convert_latex_name(self._name)
+        return self._latex_name
 
     @name.setter
     def name(self, name):
         if type(name) is str:
             self._name = name
+            self._latex_name = name
             return
 
         raise ValueError("Name of the distribution class must be a string type.")
@@ -141,7 +148,7 @@ class Distribution(nn.Module):
             _var_text += [','.join([convert_latex_name(var_name) for var_name in self._cond_var])]
 
         _prob_text = "{}({})".format(
-            self._name,
+            self.name,
             "|".join(_var_text)
         )
 
@@ -166,6 +173,44 @@ class Distribution(nn.Module):
         """torch.Size or list: Shape of features of this distribution."""
         return self._features_shape
 
+    def _get_feature_dims(self, feature_dims=None, event_dim=0):
+        """Get dimensions summed across in the output of log-likelihoods (and entropies).
+
+        Parameters
+        ----------
+        feature_dims : :obj:`int`, :obj:`list` or :obj:`NoneType`, defaults to None
+            Dimensions given explicitly.
+        event_dim : :obj:`int`, defaults to 0
+            The number of event dimensions of features, which have already been reduced in the output.
+
+        Returns
+        -------
+        :obj:`tuple` or :obj:`NoneType`
+            If neither `feature_dims` nor :attr:`features_shape` is given, None (i.e., all dimensions except
+            the first), otherwise the last dimensions of :attr:`features_shape`, so that the leading dimensions
+            of sample_shape and batch are kept.
+
+        Examples
+        --------
+        >>> p = Distribution(var=["x"], features_shape=[3, 32, 32])
+        >>> p._get_feature_dims()
+        (-3, -2, -1)
+        >>> p._get_feature_dims(event_dim=1)
+        (-2, -1)
+        >>> p._get_feature_dims(feature_dims=[1])
+        (1,)
+
+        """
+        if feature_dims is not None:
+            if isinstance(feature_dims, int):
+                return (feature_dims,)
+            return tuple(feature_dims)
+
+        if len(self.features_shape) > 0:
+            return tuple(range(event_dim - len(self.features_shape), 0))
+
+        return None
+
     def _check_input(self, input, var=None):
         """Check the type of given input.
         If the input type is :obj:`dict`, this method checks whether the input keys contains the :attr:`var` list.
@@ -181,7 +226,7 @@ class Distribution(nn.Module):
 
         Returns
         -------
-        input_dict : dict
+        input_dict : pixyz.utils.SampleDict
             Variables checked in this method.
 
         Raises
@@ -193,17 +238,18 @@ class Distribution(nn.Module):
         if var is None:
             var = self.input_var
 
-        if type(input) is torch.Tensor:
-            input_dict = {var[0]: input}
+        if isinstance(input, torch.Tensor):
+            input_dict = SampleDict({var[0]: input})
 
-        elif type(input) is list:
+        elif isinstance(input, list):
             # TODO: we need to check if all the elements contained in this list are torch.Tensor.
-            input_dict = dict(zip(var, input))
+            input_dict = SampleDict(zip(var, input))
 
-        elif type(input) is dict:
-            if not (set(list(input.keys())) >= set(var)):
+        elif isinstance(input, dict):
+            if not all(key in input for key in var):
                 raise ValueError("Input keys are not valid.")
-            input_dict = input.copy()
+            # shallow copy: samples are shared with the given input
+            input_dict = SampleDict(input)
 
         else:
             raise ValueError("The type of input is not valid, got %s." % type(input))
@@ -397,6 +443,48 @@ class Distribution(nn.Module):
         """
         raise NotImplementedError()
 
+    def sample_mode(self, x_dict={}):
+        """Return the mode of the distribution.
+
+        Parameters
+        ----------
+        x_dict : :obj:`dict`, defaults to {}
+            Parameters of this distribution.
+
+        Examples
+        --------
+        >>> import torch
+        >>> from pixyz.distributions import Bernoulli
+        >>> p = Bernoulli(probs="y", var=["x"], cond_var=["y"], features_shape=[3])
+        >>> p.sample_mode({"y": torch.tensor([[0.2, 0.7, 0.9]])})
+        tensor([[0., 1., 1.]])
+
+        """
+        raise NotImplementedError()
+
+    def _get_point_estimate(self, x_dict={}, mode=False):
+        """Return the mean or the mode of each variable of this distribution as a dictionary.
+
+        Parameters
+        ----------
+        x_dict : :obj:`dict`, defaults to {}
+            Input variables, which can contain unused variables.
+        mode : :obj:`bool`, defaults to False
+            If True, the mode is returned instead of the mean.
+
+        Returns
+        -------
+        dict
+
+        """
+        if len(self.var) != 1:
+            raise NotImplementedError()
+
+        input_dict = get_dict_values(x_dict, self.input_var, return_dict=True)
+        if mode:
+            return {self.var[0]: self.sample_mode(input_dict)}
+        return {self.var[0]: self.sample_mean(input_dict)}
+
     def get_log_prob(self, x_dict, sum_features=True, feature_dims=None):
         """Giving variables, this method returns values of log-pdf.
 
@@ -408,6 +496,7 @@ class Distribution(nn.Module):
             Whether the output is summed across some dimensions which are specified by `feature_dims`.
         feature_dims : :obj:`list` or :obj:`NoneType`, defaults to None
             Set dimensions to sum across the output.
+            If None, dimensions of :attr:`features_shape` (if given) or all dimensions except the first are summed.
 
         Returns
         -------
@@ -448,6 +537,7 @@ class Distribution(nn.Module):
             Whether the output is summed across some dimensions which are specified by :attr:`feature_dims`.
         feature_dims : :obj:`list` or :obj:`NoneType`, defaults to None
             Set dimensions to sum across the output.
+            If None, dimensions of :attr:`features_shape` (if given) or all dimensions except the first are summed.
 
         Returns
         -------
@@ -520,10 +610,12 @@ class Distribution(nn.Module):
         Parameters
         ----------
         sum_features : :obj:`bool`, defaults to True
-            Choose whether the output is summed across some axes (dimensions)
-            which are specified by :attr:`feature_dims`.
+            Choose whether the log-likelihood is summed across some axes (dimensions)
+            which are specified by :attr:`feature_dims` before exponentiation.
         feature_dims : :obj:`list` or :obj:`NoneType`, defaults to None
-            Set dimensions to sum across the output. (Note: this parameter is not used for now.)
+            Set dimensions to sum across the output.
+            If None, dimensions of :attr:`features_shape` (if given) or all dimensions except the first are summed,
+            so that the leading dimensions of samples wider than :attr:`features_shape` are kept.
 
         Returns
         -------
@@ -550,6 +642,14 @@ class Distribution(nn.Module):
         >>> print(prob) # doctest: +SKIP
         tensor([2.9628e-09])
 
+        >>> # Only the dimensions of features_shape are reduced
+        >>> p3 = Normal(loc=torch.tensor(0.), scale=torch.tensor(1.), var=["x"], features_shape=[2])
+        >>> sample_x = torch.zeros(4, 3, 2)
+        >>> p3.prob().eval({"x": sample_x}).shape
+        torch.Size([4, 3])
+        >>> p3.prob(feature_dims=[1, 2]).eval({"x": sample_x}).shape
+        torch.Size([4])
+
         """
         return Prob(self, sum_features=sum_features, feature_dims=feature_dims)
 
@@ -629,6 +729,7 @@ class DistributionBase(Distribution):
     def __init__(self, cond_var=[], var=["x"], name="p", features_shape=torch.Size(), **kwargs):
         super().__init__(cond_var=cond_var, var=var, name=name, features_shape=features_shape)
 
+        self._binding_plan = None
         self._set_buffers(**kwargs)
         self._dist = None
 
@@ -717,7 +818,7 @@ class DistributionBase(Distribution):
                              f" {set(self.params_keys)}\n"
                              f"but got {set(params.keys())}")
 
-        self._dist = self.distribution_torch_class(**params)
+        self._dist = self._create_dist(self.distribution_torch_class, **params)
 
         # expand batch_n
         if batch_n:
@@ -729,6 +830,14 @@ class DistributionBase(Distribution):
             else:
                 raise ValueError()
 
+    @staticmethod
+    def _create_dist(distribution_torch_class, **params):
+        """Create an instance of PyTorch distribution, following the global setting of :func:`validate_args`."""
+        _validate_args = validate_args()
+        if _validate_args is not None:
+            return distribution_torch_class(validate_args=_validate_args, **params)
+        return distribution_torch_class(**params)
+
     def get_sample(self, reparam=False, sample_shape=torch.Size()):
         """Get a sample_shape shaped sample from :attr:`dist`.
 
@@ -757,40 +866,67 @@ class DistributionBase(Distribution):
 
         return samples_dict
 
-    def get_log_prob(self, x_dict, sum_features=True, feature_dims=None):
+    def get_log_prob(self, x_dict, sum_features=True, feature_dims=None, **kwargs):
         _x_dict = get_dict_values(x_dict, self._cond_var, return_dict=True)
-        self.set_dist(_x_dict, sampling=False)
+        self.set_dist(_x_dict, sampling=False, **kwargs)
 
         x_targets = get_dict_values(x_dict, self._var)
         log_prob = self.dist.log_prob(*x_targets)
         if sum_features:
-            log_prob = sum_samples(log_prob)
+            log_prob = sum_samples(log_prob, self._get_feature_dims(feature_dims, len(self.dist.event_shape)))
 
         return log_prob
 
+    def register_buffer(self, name, tensor, *args, **kwargs):
+        super().register_buffer(name, tensor, *args, **kwargs)
+        self._binding_plan = None
+
+    def _apply(self, fn, *args, **kwargs):
+        self._binding_plan = None
+        return super()._apply(fn, *args, **kwargs)
+
+    def _get_binding_plan(self):
+        """Return the names of constant parameters stored as buffers of this distribution.
+
+        The plan is resolved once and reset when buffers are registered or moved by :meth:`to`.
+
+        """
+        if self._binding_plan is None:
+            self._binding_plan = tuple(key for key in self.params_keys if key in self._buffers)
+        return self._binding_plan
+
     def get_params(self, params_dict={}):
+        cache = get_cache_scope()
+        if cache is not None:
+            return cache.memoize(self, params_dict, lambda: self._get_params(params_dict))
+
+        return self._get_params(params_dict)
+
+    def _get_params(self, params_dict={}):
         params_dict, vars_dict = replace_dict_keys_split(params_dict, self.replace_params_dict)
         output_dict = self.forward(**vars_dict)
 
         output_dict.update(params_dict)
 
         # append constant parameters to output_dict
-        constant_params_dict = get_dict_values(dict(self.named_buffers()), self.params_keys, return_dict=True)
-        output_dict.update(constant_params_dict)
+        buffers = self._buffers
+        for key in self._get_binding_plan():
+            if buffers[key] is not None:
+                output_dict[key] = buffers[key]
 
         return output_dict
 
-    def get_entropy(self, x_dict={}, sum_features=True, feature_dims=None):
+    def get_entropy(self, x_dict={}, sum_features=True, feature_dims=None, **kwargs):
         _x_dict = get_dict_values(x_dict, self._cond_var, return_dict=True)
-        self.set_dist(_x_dict, sampling=False)
+        self.set_dist(_x_dict, sampling=False, **kwargs)
 
         entropy = self.dist.entropy()
         if sum_features:
-            entropy = sum_samples(entropy)
+            entropy = sum_samples(entropy, self._get_feature_dims(feature_dims, len(self.dist.event_shape)))
 
         return entropy
 
-    def sample(self, x_dict={}, batch_n=None, sample_shape=torch.Size(), return_all=True, reparam=False):
+    def sample(self, x_dict={}, batch_n=None, sample_shape=torch.Size(), return_all=True, reparam=False, **kwargs):
         # check whether the input is valid or convert it to valid dictionary.
         x_dict = self._check_input(x_dict)
         input_dict = {}
@@ -799,7 +935,7 @@ class DistributionBase(Distribution):
         if len(self.input_var) != 0:
             input_dict.update(get_dict_values(x_dict, self.input_var, return_dict=True))
 
-        self.set_dist(input_dict, batch_n=batch_n)
+        self.set_dist(input_dict, batch_n=batch_n, **kwargs)
         output_dict = self.get_sample(reparam=reparam,
                                       sample_shape=sample_shape)
 
@@ -817,6 +953,10 @@ class DistributionBase(Distribution):
         self.set_dist(x_dict)
         return self.dist.variance
 
+    def sample_mode(self, x_dict={}):
+        self.set_dist(x_dict)
+        return self.dist.mode
+
     def forward(self, **params):
         return params
 
@@ -835,6 +975,11 @@ class MultiplyDistribution(Distribution):
 
     p(x|z)p(x|y) -> Invalid (conflict)
 
+    Products of products are flattened into a single list of factors sorted in a topological order
+    (parents precede their children), so that sampling and evaluating the log-likelihood are linear loops over
+    the factors.
+    If :func:`pixyz.utils.set_parallel_branches` is set, independent factors are evaluated concurrently.
+
     Examples
     --------
     >>> a = DistributionBase(var=["x"], cond_var=["z"])
@@ -880,6 +1025,12 @@ class MultiplyDistribution(Distribution):
         name=p, distribution_name=,
         var=['x'], cond_var=['z'], input_var=['z'], features_shape=torch.Size([])
       )
+    >>> c = DistributionBase(var=["a"])
+    >>> p_multi = MultiplyDistribution(p_multi, c)
+    >>> print(p_multi.prob_factorized_text)
+    p(x|z)p(y|a)p(a)
+    >>> [factor.prob_text for factor in p_multi.factors]
+    ['p(a)', 'p(y|a)', 'p(x|z)']
 
     """
 
@@ -944,49 +1095,313 @@ class MultiplyDistribution(Distribution):
         self._parent = _parent
         self._child = _child
 
+        # Flatten factors in a topological order. Variables of the child are not required by the parent
+        # (otherwise they are recursive), so the factors of the parent precede those of the child.
+        self._factors = self._get_factors(_parent) + self._get_factors(_child)
+        self._schedules = {}
+
         # Set input_var (it might be different from cond_var if either a and b contain data distributions.)
         _input_var = [var for var in self._child.input_var if var not in _inh_var]
         _input_var += self._parent.input_var
         self._input_var = sorted(set(_input_var), key=_input_var.index)
 
+    @staticmethod
+    def _get_factors(p):
+        if isinstance(p, MultiplyDistribution):
+            return p._factors
+        return [p]
+
     @property
     def input_var(self):
         return self._input_var
 
+    @property
+    def factors(self):
+        """list: Factors of this distribution sorted in a topological order."""
+        return list(self._factors)
+
     @property
     def prob_factorized_text(self):
-        return self._child.prob_factorized_text + self._parent.prob_factorized_text
+        return "".join(factor.prob_factorized_text for factor in reversed(self._factors))
+
+    def _get_required_factors(self, target_var=None):
+        """Get factors required to sample `target_var`, i.e., factors of `target_var` and their ancestors.
+
+        Parameters
+        ----------
+        target_var : :obj:`list` of :obj:`str` or :obj:`NoneType`, defaults to None
+            Variables to sample. If None, all factors are returned.
+
+        Returns
+        -------
+        factors : :obj:`list` of :class:`pixyz.distributions.Distribution`
+            Required factors in the topological order.
+        input_var : :obj:`list` of :obj:`str`
+            Input variables of the required factors which are not sampled by them.
+
+        """
+        if target_var is None:
+            return self._factors, self.input_var
+
+        # walk backwards from target variables over the factors.
+        required_var = set(target_var)
+        factors = []
+        for factor in reversed(self._factors):
+            if required_var.isdisjoint(factor.var):
+                continue
+            factors.append(factor)
+            required_var.update(factor.input_var)
+        factors.reverse()
+
+        sampled_var = set(var for factor in factors for var in factor.var)
+        input_var = [var for var in self.input_var if var in required_var and var not in sampled_var]
+        return factors, input_var
+
+    def _get_schedule(self, factors, sampling=True):
+        """Group factors into stages of factors which can be evaluated concurrently.
+
+        For sampling, each factor is assigned to the stage after those of the factors sampling its inputs.
+        Otherwise, all factors are independent. Factors sharing modules (e.g., a distribution and its
+        :class:`ReplaceVarDistribution`) are not evaluated concurrently because distributions keep states.
+
+        Parameters
+        ----------
+        factors : :obj:`list` of :class:`pixyz.distributions.Distribution`
+            Factors in the topological order.
+        sampling : :obj:`bool`, defaults to True
+            Whether the factors are sampled.
+
+        Returns
+        -------
+        :obj:`list` of :obj:`list` of :class:`pixyz.distributions.Distribution`
+            Stages in the order of evaluation, where factors of each stage are in the topological order.
+
+        Examples
+        --------
+        >>> a = DistributionBase(var=["x"], cond_var=["z"])
+        >>> b = DistributionBase(var=["y"], cond_var=["z"])
+        >>> c = DistributionBase(var=["z"])
+        >>> p = a * b * c
+        >>> [[factor.prob_text for factor in stage] for stage in p._get_schedule(p.factors)]
+        [['p(z)'], ['p(y|z)', 'p(x|z)']]
+
+        """
+        key = (tuple(map(id, factors)), sampling)
+        if key in self._schedules:
+            return self._schedules[key]
+
+        stages = []
+        stage_of_var = {}
+        for factor in factors:
+            index = 0
+            if sampling:
+                index = max([stage_of_var[var] + 1 for var in factor.input_var if var in stage_of_var], default=0)
+            if index == len(stages):
+                stages.append([])
+            stages[index].append(factor)
+            for var in factor.var:
+                stage_of_var[var] = index
+
+        schedule = []
+        for stage in stages:
+            modules = [set(map(id, factor.modules())) for factor in stage]
+            if sum(map(len, modules)) == len(set().union(*modules)):
+                schedule.append(stage)
+            else:
+                schedule += [[factor] for factor in stage]
+
+        self._schedules[key] = schedule
+        return schedule
+
+    @staticmethod
+    def _expand_inputs(x_dict, input_var, sampled_var, sample_shape):
+        """Broadcast inputs which are not sampled to sample_shape by expand views."""
+        input_dict = get_dict_values(x_dict, input_var, return_dict=True)
+        for var, value in input_dict.items():
+            if var not in sampled_var and isinstance(value, torch.Tensor):
+                input_dict[var] = value.expand(sample_shape + value.shape)
+        return input_dict
+
+    def sample(self, x_dict={}, batch_n=None, sample_shape=torch.Size(), return_all=True, reparam=False,
+               target_var=None, **kwargs):
+        """Sample variables of this distribution by ancestral sampling.
+
+        Parameters
+        ----------
+        x_dict : :obj:`torch.Tensor`, :obj:`list`, or :obj:`dict`, defaults to {}
+            Input variables.
+        batch_n : :obj:`int`, defaults to None.
+            Set batch size of parameters.
+        sample_shape : :obj:`list` or :obj:`NoneType`, defaults to torch.Size()
+            Shape of generating samples.
+            Factors conditioned on samples of other factors are sampled once for each of them,
+            and their other inputs are broadcast to sample_shape.
+        return_all : :obj:`bool`, defaults to True
+            Choose whether the output contains input variables.
+        reparam : :obj:`bool`, defaults to False.
+            Choose whether we sample variables with re-parameterized trick.
+        target_var : :obj:`list` of :obj:`str`, defaults to None
+            Variables required by the caller. If given, only the factors of these variables and their ancestors
+            are sampled, and inputs of the other factors are not required.
+
+        Returns
+        -------
+        output : dict
+            Samples of this distribution.
+
+        Examples
+        --------
+        >>> from pixyz.distributions import Normal
+        >>> q_a = Normal(loc="x", scale=torch.tensor(1.), var=["a"], cond_var=["x"])
+        >>> q_z = Normal(loc="x", scale=torch.tensor(1.), var=["z"], cond_var=["x"])
+        >>> q_y = Normal(loc="a", scale="w", var=["y"], cond_var=["a", "w"])
+        >>> q = q_y * q_z * q_a
+        >>> sorted(q.sample({"x": torch.zeros(1), "w": torch.ones(1)}).keys())
+        ['a', 'w', 'x', 'y', 'z']
+        >>> sorted(q.sample({"x": torch.zeros(1)}, target_var=["z"]).keys())
+        ['x', 'z']
+        >>> q.sample({"x": torch.zeros(2, 1), "w": torch.ones(2, 1)}, sample_shape=[5])["y"].shape
+        torch.Size([5, 2, 1])
+        >>> p_z = Normal(loc=torch.tensor(0.), scale=torch.tensor(1.), var=["z"], features_shape=[2])
+        >>> p_x = Normal(loc="z", scale=torch.tensor(1.), var=["x"], cond_var=["z"])
+        >>> (p_x * p_z).sample(batch_n=3, sample_shape=[5])["x"].shape
+        torch.Size([5, 3, 2])
+
+        """
+        factors, input_var = self._get_required_factors(target_var)
+        output_dict = self._check_input(x_dict, var=input_var)
+        sample_shape = torch.Size(sample_shape)
 
-    def sample(self, x_dict={}, batch_n=None, return_all=True, reparam=False, **kwargs):
-        # sample from the parent distribution
-        parents_x_dict = x_dict
-        child_x_dict = self._parent.sample(x_dict=parents_x_dict, batch_n=batch_n,
-                                           return_all=True, reparam=reparam)
-        # sample from the child distribution
-        output_dict = self._child.sample(x_dict=child_x_dict, batch_n=batch_n,
-                                         return_all=True, reparam=reparam)
+        if parallel_branches() > 1:
+            stages = self._get_schedule(factors)
+        else:
+            stages = [[factor] for factor in factors]
+
+        # sample from each stage in the topological order and accumulate samples in a single dictionary.
+        # `sampled_var` have the leading dimensions of sample_shape.
+        sampled_var = set()
+        for stage in stages:
+            functions = []
+            for factor in stage:
+                if len(sample_shape) == 0 or sampled_var.isdisjoint(factor.input_var):
+                    factor_dict, factor_sample_shape, factor_batch_n = output_dict, sample_shape, batch_n
+                else:
+                    # the inputs already carry the sample and batch dimensions.
+                    factor_dict = self._expand_inputs(output_dict, factor.input_var, sampled_var, sample_shape)
+                    factor_sample_shape, factor_batch_n = torch.Size(), None
+
+                functions.append(functools.partial(factor.sample, factor_dict, batch_n=factor_batch_n,
+                                                   sample_shape=factor_sample_shape, return_all=False,
+                                                   reparam=reparam))
+
+            for factor, samples in zip(stage, map_branches(functions)):
+                output_dict.update(get_dict_values(samples, factor.var, return_dict=True))
+                sampled_var.update(factor.var)
 
         if return_all is False:
-            output_dict = get_dict_values(output_dict, self._var, return_dict=True)
+            output_dict = get_dict_values(output_dict, [var for factor in factors for var in factor.var],
+                                          return_dict=True)
             return output_dict
 
         return output_dict
 
+    def _get_point_estimate(self, x_dict={}, mode=False, target_var=None):
+        factors, input_var = self._get_required_factors(target_var)
+        output_dict = self._check_input(x_dict, var=input_var)
+
+        # feed the mean (or the mode) of each factor into its children in the topological order.
+        for factor in factors:
+            output_dict.update(factor._get_point_estimate(output_dict, mode=mode))
+
+        if target_var is None:
+            target_var = [var for factor in factors for var in factor.var]
+        return get_dict_values(output_dict, target_var, return_dict=True)
+
+    def sample_mean(self, x_dict={}, target_var=None):
+        """Return the plug-in estimate of the mean of variables of this distribution.
+
+        The mean of each factor is fed into its children instead of samples, so all variables are
+        computed by a single pass without Monte Carlo sampling. This is run under :func:`torch.inference_mode`,
+        so that the outputs cannot be used for backpropagation.
+
+        Parameters
+        ----------
+        x_dict : :obj:`torch.Tensor`, :obj:`list`, or :obj:`dict`, defaults to {}
+            Input variables.
+        target_var : :obj:`list` of :obj:`str`, defaults to None
+            Variables to return. If given, only the factors of these variables and their ancestors are run.
+
+        Returns
+        -------
+        dict
+            Means of variables of this distribution (or `target_var`).
+
+        Examples
+        --------
+        >>> from pixyz.distributions import Normal
+        >>> p_z = Normal(loc="x", scale=torch.tensor(1.), var=["z"], cond_var=["x"])
+        >>> p_y = Normal(loc="z", scale=torch.tensor(1.), var=["y"], cond_var=["z"])
+        >>> p = p_y * p_z.replace_var(x="w")
+        >>> p.sample_mean({"w": torch.ones(1)})
+        {'z': tensor([1.]), 'y': tensor([1.])}
+        >>> p.sample_mean({"w": torch.ones(1)}, target_var=["z"])
+        {'z': tensor([1.])}
+
+        """
+        with torch.inference_mode():
+            return self._get_point_estimate(x_dict, target_var=target_var)
+
+    def sample_mode(self, x_dict={}, target_var=None):
+        """Return the plug-in estimate of the mode of variables of this distribution.
+
+        See :meth:`sample_mean`.
+
+        Parameters
+        ----------
+        x_dict : :obj:`torch.Tensor`, :obj:`list`, or :obj:`dict`, defaults to {}
+            Input variables.
+        target_var : :obj:`list` of :obj:`str`, defaults to None
+            Variables to return. If given, only the factors of these variables and their ancestors are run.
+
+        Returns
+        -------
+        dict
+            Modes of variables of this distribution (or `target_var`).
+
+        """
+        with torch.inference_mode():
+            return self._get_point_estimate(x_dict, mode=True, target_var=target_var)
+
     def get_log_prob(self, x_dict, sum_features=True, feature_dims=None):
-        parent_log_prob = self._parent.get_log_prob(x_dict, sum_features=sum_features, feature_dims=feature_dims)
-        child_log_prob = self._child.get_log_prob(x_dict, sum_features=sum_features, feature_dims=feature_dims)
+        return self._get_factors_log_prob(self._factors, x_dict, sum_features=sum_features,
+                                          feature_dims=feature_dims)
 
-        if sum_features:
-            return parent_log_prob + child_log_prob
+    def _get_factors_log_prob(self, factors, x_dict, sum_features=True, feature_dims=None):
+        """Sum the log-likelihoods of the given factors of this distribution."""
+        if parallel_branches() > 1:
+            stages = self._get_schedule(factors, sampling=False)
+        else:
+            stages = [[factor] for factor in factors]
+
+        factor_log_probs = []
+        for stage in stages:
+            factor_log_probs += map_branches([functools.partial(factor.get_log_prob, x_dict,
+                                                                sum_features=sum_features, feature_dims=feature_dims)
+                                              for factor in stage])
+
+        # sum in the order of factors so that the result does not depend on the schedule.
+        log_prob = 0
+        for factor, factor_log_prob in zip(factors, factor_log_probs):
+            if not sum_features and torch.is_tensor(log_prob) and log_prob.size() != factor_log_prob.size():
+                raise ValueError(f"The PDF of {factor.prob_text} has a different size from those of the other"
+                                 f" factors, so you must modify these tensor sizes.")
 
-        if parent_log_prob.size() == child_log_prob.size():
-            return parent_log_prob + child_log_prob
+            log_prob = log_prob + factor_log_prob
 
-        raise ValueError(f"Two PDFs, {self._parent.prob_text} and {self._child.prob_text}, have different sizes,"
-                         f" so you must modify these tensor sizes.")
+        return log_prob
 
     def __repr__(self):
-        return self._parent.__repr__() + "\n" + self._child.__repr__()
+        return "\n".join(factor.__repr__() for factor in self._factors)
 
 
 class ReplaceVarDistribution(Distribution):
@@ -1099,6 +1514,17 @@ class ReplaceVarDistribution(Distribution):
         input_dict = replace_dict_keys(input_dict, self._replace_inv_cond_var_dict)
         return self.p.sample_variance(input_dict)
 
+    def sample_mode(self, x_dict={}):
+        input_dict = get_dict_values(x_dict, self.cond_var, return_dict=True)
+        input_dict = replace_dict_keys(input_dict, self._replace_inv_cond_var_dict)
+        return self.p.sample_mode(input_dict)
+
+    def _get_point_estimate(self, x_dict={}, mode=False):
+        input_dict = get_dict_values(x_dict, self.input_var, return_dict=True)
+        input_dict = replace_dict_keys(input_dict, self._replace_inv_cond_var_dict)
+        output_dict = self.p._get_point_estimate(input_dict, mode=mode)
+        return replace_dict_keys(output_dict, self._replace_dict)
+
     @property
     def input_var(self):
         return self._input_var
@@ -1203,12 +1629,90 @@ class MarginalizeVarDistribution(Distribution):
 
         return output_dict
 
-    def sample_mean(self, x_dict={}):
-        return self.p.sample_mean(x_dict)
+    def _split_deterministic_factors(self):
+        """Split factors of `p` into the deterministic factors of the marginalized variables and the others.
+
+        Returns
+        -------
+        deterministic_factors : :obj:`list` of :class:`pixyz.distributions.Distribution`
+        factors : :obj:`list` of :class:`pixyz.distributions.Distribution`
+
+        """
+        factors = self.p.factors if isinstance(self.p, MultiplyDistribution) else [self.p]
+
+        deterministic_factors = []
+        other_factors = []
+        for factor in factors:
+            if set(factor.var).isdisjoint(self._marginalize_list):
+                other_factors.append(factor)
+            elif factor.distribution_name == "Deterministic" and set(factor.var) <= set(self._marginalize_list):
+                deterministic_factors.append(factor)
+            else:
+                raise NotImplementedError(f"The log-likelihood can be evaluated only if marginalized variables are"
+                                          f" outputs of deterministic distributions, got {factor.prob_text}.")
+        return deterministic_factors, other_factors
+
+    def get_log_prob(self, x_dict, sum_features=True, feature_dims=None, **kwargs):
+        r"""Giving variables, get the log-likelihood of this distribution.
+
+        Marginalized variables must be outputs of deterministic distributions, e.g., :math:`h = f(x)`
+        in :math:`q(z|x) = \int q(z|h)\delta(h - f(x))dh = q(z|f(x))`. They are computed from the given inputs
+        and fed to the other factors.
+
+        Parameters
+        ----------
+        x_dict : dict
+            Input variables.
+        sum_features : :obj:`bool`, defaults to True
+            Whether the output is summed across some dimensions which are specified by `feature_dims`.
+        feature_dims : :obj:`list` or :obj:`NoneType`, defaults to None
+            Set dimensions to sum across the output.
+
+        Returns
+        -------
+        log_prob : torch.Tensor
+            Values of log-probability density/mass function.
+
+        """
+        deterministic_factors, factors = self._split_deterministic_factors()
+
+        x_dict = dict(x_dict)
+        for factor in deterministic_factors:
+            x_dict.update(factor.sample(x_dict, return_all=False))
+
+        return self.p._get_factors_log_prob(factors, x_dict, sum_features=sum_features, feature_dims=feature_dims)
+
+    def sample_mean(self, x_dict={}, target_var=None):
+        """Return the plug-in estimate of the mean of variables of this distribution.
+
+        See :meth:`MultiplyDistribution.sample_mean`.
+
+        """
+        with torch.inference_mode():
+            return self._get_point_estimate(x_dict, target_var=target_var)
 
     def sample_variance(self, x_dict={}):
         return self.p.sample_variance(x_dict)
 
+    def sample_mode(self, x_dict={}, target_var=None):
+        """Return the plug-in estimate of the mode of variables of this distribution.
+
+        See :meth:`MultiplyDistribution.sample_mean`.
+
+        """
+        with torch.inference_mode():
+            return self._get_point_estimate(x_dict, mode=True, target_var=target_var)
+
+    def _get_point_estimate(self, x_dict={}, mode=False, target_var=None):
+        if target_var is None:
+            target_var = self.var
+
+        if isinstance(self.p, MultiplyDistribution):
+            return self.p._get_point_estimate(x_dict, mode=mode, target_var=target_var)
+
+        output_dict = self.p._get_point_estimate(x_dict, mode=mode)
+        return get_dict_values(output_dict, target_var, return_dict=True)
+
     @property
     def input_var(self):
         return self.p.input_var
@@ -10,8 +10,9 @@ from torch.distributions import Beta as BetaTorch
 from torch.distributions import Laplace as LaplaceTorch
 from torch.distributions import Gamma as GammaTorch
 
-from ..utils import get_dict_values, sum_samples
+from ..utils import get_dict_values, sum_samples, fast_distributions
 from .distributions import DistributionBase
+from .fast_distributions import FastNormal, FastBernoulli, FastCategorical, FastLaplace
 
 
 class Normal(DistributionBase):
@@ -23,6 +24,8 @@ class Normal(DistributionBase):
 
     @property
     def distribution_torch_class(self):
+        if fast_distributions():
+            return FastNormal
         return NormalTorch
 
     @property
@@ -39,6 +42,8 @@ class Bernoulli(DistributionBase):
 
     @property
     def distribution_torch_class(self):
+        if fast_distributions():
+            return FastBernoulli
         return BernoulliTorch
 
     @property
@@ -75,9 +80,10 @@ class RelaxedBernoulli(Bernoulli):
     def set_dist(self, x_dict={}, sampling=True, batch_n=None, **kwargs):
         params = self.get_params(x_dict)
         if sampling is True:
-            self._dist = self.relaxed_distribution_torch_class(temperature=self.temperature, **params)
+            self._dist = self._create_dist(self.relaxed_distribution_torch_class, temperature=self.temperature,
+                                           **params)
         else:
-            self._dist = self.distribution_torch_class(**params)
+            self._dist = self._create_dist(self.distribution_torch_class, **params)
 
         # expand batch_n
         if batch_n:
@@ -89,6 +95,18 @@ class RelaxedBernoulli(Bernoulli):
             else:
                 raise ValueError()
 
+    def sample_mean(self, x_dict={}):
+        self.set_dist(x_dict, sampling=False)
+        return self.dist.mean
+
+    def sample_variance(self, x_dict={}):
+        self.set_dist(x_dict, sampling=False)
+        return self.dist.variance
+
+    def sample_mode(self, x_dict={}):
+        self.set_dist(x_dict, sampling=False)
+        return self.dist.mode
+
 
 class FactorizedBernoulli(Bernoulli):
     """
@@ -121,6 +139,8 @@ class Categorical(DistributionBase):
 
     @property
     def distribution_torch_class(self):
+        if fast_distributions():
+            return FastCategorical
         return CategoricalTorch
 
     @property
@@ -157,9 +177,10 @@ class RelaxedCategorical(Categorical):
     def set_dist(self, x_dict={}, sampling=True, batch_n=None, **kwargs):
         params = self.get_params(x_dict)
         if sampling is True:
-            self._dist = self.relaxed_distribution_torch_class(temperature=self.temperature, **params)
+            self._dist = self._create_dist(self.relaxed_distribution_torch_class, temperature=self.temperature,
+                                           **params)
         else:
-            self._dist = self.distribution_torch_class(**params)
+            self._dist = self._create_dist(self.distribution_torch_class, **params)
 
         # expand batch_n
         if batch_n:
@@ -179,6 +200,10 @@ class RelaxedCategorical(Categorical):
         self.set_dist(x_dict, sampling=False)
         return self.dist.variance
 
+    def sample_mode(self, x_dict={}):
+        self.set_dist(x_dict, sampling=False)
+        return self.dist.mode
+
 
 class Multinomial(DistributionBase):
     """Multinomial distribution parameterized by :attr:`total_count` and :attr:`probs`."""
@@ -248,6 +273,8 @@ class Laplace(DistributionBase):
 
     @property
     def distribution_torch_class(self):
+        if fast_distributions():
+            return FastLaplace
         return LaplaceTorch
 
     @property
@@ -0,0 +1,276 @@
+import math
+import torch
+from torch.distributions import Distribution as DistributionTorch
+from torch.distributions import constraints
+from torch.distributions import register_kl
+from torch.nn import functional as F
+
+_LOG_SQRT_2PI = 0.5 * math.log(2 * math.pi)
+
+
+def _clamp_probs(probs):
+    eps = torch.finfo(probs.dtype).eps
+    return probs.clamp(min=eps, max=1 - eps)
+
+
+class FastNormal(DistributionTorch):
+    r"""Lightweight normal distribution computed directly from :attr:`loc` and :attr:`scale`.
+
+    This class can be used in place of :class:`torch.distributions.Normal`.
+    Arguments are not broadcast unless their shapes differ, and they are not validated unless
+    :attr:`validate_args` is True.
+
+    Examples
+    --------
+    >>> from torch.distributions import Normal as NormalTorch, kl_divergence
+    >>> loc, scale = torch.randn(2, 3), torch.rand(2, 3) + 0.5
+    >>> p, p_torch = FastNormal(loc, scale), NormalTorch(loc, scale)
+    >>> x = torch.randn(2, 3)
+    >>> torch.allclose(p.log_prob(x), p_torch.log_prob(x))
+    True
+    >>> torch.allclose(p.entropy(), p_torch.entropy())
+    True
+    >>> q, q_torch = FastNormal(torch.zeros(3), torch.ones(3)), NormalTorch(torch.zeros(3), torch.ones(3))
+    >>> torch.allclose(kl_divergence(p, q), kl_divergence(p_torch, q_torch))
+    True
+    >>> p.rsample((4,)).shape
+    torch.Size([4, 2, 3])
+    """
+    arg_constraints = {"loc": constraints.real, "scale": constraints.positive}
+    support = constraints.real
+    has_rsample = True
+
+    def __init__(self, loc, scale, validate_args=None):
+        if loc.shape != scale.shape:
+            loc, scale = torch.broadcast_tensors(loc, scale)
+        self.loc = loc
+        self.scale = scale
+        super().__init__(loc.shape, validate_args=bool(validate_args))
+
+    @property
+    def mean(self):
+        return self.loc
+
+    @property
+    def mode(self):
+        return self.loc
+
+    @property
+    def stddev(self):
+        return self.scale
+
+    @property
+    def variance(self):
+        return self.scale.pow(2)
+
+    def expand(self, batch_shape, _instance=None):
+        return FastNormal(self.loc.expand(batch_shape), self.scale.expand(batch_shape))
+
+    def rsample(self, sample_shape=torch.Size()):
+        eps = torch.randn(self._extended_shape(sample_shape), dtype=self.loc.dtype, device=self.loc.device)
+        return self.loc + eps * self.scale
+
+    def sample(self, sample_shape=torch.Size()):
+        with torch.no_grad():
+            return self.rsample(sample_shape)
+
+    def log_prob(self, value):
+        if self._validate_args:
+            self._validate_sample(value)
+        return -0.5 * ((value - self.loc) / self.scale).pow(2) - self.scale.log() - _LOG_SQRT_2PI
+
+    def entropy(self):
+        return 0.5 + _LOG_SQRT_2PI + self.scale.log()
+
+
+class FastBernoulli(DistributionTorch):
+    r"""Lightweight Bernoulli distribution computed directly from :attr:`probs`.
+
+    This class can be used in place of :class:`torch.distributions.Bernoulli`.
+
+    Examples
+    --------
+    >>> from torch.distributions import Bernoulli as BernoulliTorch
+    >>> probs = torch.rand(2, 3)
+    >>> p, p_torch = FastBernoulli(probs), BernoulliTorch(probs)
+    >>> x = torch.bernoulli(torch.rand(2, 3))
+    >>> torch.allclose(p.log_prob(x), p_torch.log_prob(x), atol=1e-6)
+    True
+    >>> torch.allclose(p.entropy(), p_torch.entropy(), atol=1e-6)
+    True
+    """
+    arg_constraints = {"probs": constraints.unit_interval}
+    support = constraints.boolean
+    has_rsample = False
+
+    def __init__(self, probs, validate_args=None):
+        self.probs = probs
+        super().__init__(probs.shape, validate_args=bool(validate_args))
+
+    @property
+    def mean(self):
+        return self.probs
+
+    @property
+    def mode(self):
+        # same as torch.distributions.Bernoulli, where the mode is undefined (NaN) for probs = 0.5.
+        mode = (self.probs >= 0.5).to(self.probs)
+        return mode.masked_fill(self.probs == 0.5, float("nan"))
+
+    @property
+    def variance(self):
+        return self.probs * (1 - self.probs)
+
+    def expand(self, batch_shape, _instance=None):
+        return FastBernoulli(self.probs.expand(batch_shape))
+
+    def sample(self, sample_shape=torch.Size()):
+        with torch.no_grad():
+            return torch.bernoulli(self.probs.expand(self._extended_shape(sample_shape)))
+
+    def log_prob(self, value):
+        if self._validate_args:
+            self._validate_sample(value)
+        probs = _clamp_probs(self.probs)
+        return value * probs.log() + (1 - value) * (-probs).log1p()
+
+    def entropy(self):
+        probs = _clamp_probs(self.probs)
+        return -(probs * probs.log() + (1 - probs) * (-probs).log1p())
+
+
+class FastCategorical(DistributionTorch):
+    r"""Lightweight one-hot categorical distribution computed directly from :attr:`probs`.
+
+    This class can be used in place of :class:`torch.distributions.OneHotCategorical`.
+    The last dimension of :attr:`probs` indexes categories, and :attr:`probs` is normalized to sum to one.
+
+    Examples
+    --------
+    >>> from torch.distributions import OneHotCategorical as CategoricalTorch
+    >>> probs = torch.rand(2, 4)
+    >>> p, p_torch = FastCategorical(probs), CategoricalTorch(probs)
+    >>> x = p_torch.sample()
+    >>> torch.allclose(p.log_prob(x), p_torch.log_prob(x))
+    True
+    >>> torch.allclose(p.entropy(), p_torch.entropy())
+    True
+    >>> p.sample((3,)).sum(-1)
+    tensor([[1., 1.],
+            [1., 1.],
+            [1., 1.]])
+    """
+    arg_constraints = {"probs": constraints.simplex}
+    support = constraints.one_hot
+    has_rsample = False
+
+    def __init__(self, probs, validate_args=None):
+        self.probs = probs / probs.sum(-1, keepdim=True)
+        super().__init__(probs.shape[:-1], probs.shape[-1:], validate_args=bool(validate_args))
+
+    @property
+    def logits(self):
+        return _clamp_probs(self.probs).log()
+
+    @property
+    def mean(self):
+        return self.probs
+
+    @property
+    def mode(self):
+        return F.one_hot(self.probs.argmax(-1), self.event_shape[0]).to(self.probs)
+
+    @property
+    def variance(self):
+        return self.probs * (1 - self.probs)
+
+    def expand(self, batch_shape, _instance=None):
+        return FastCategorical(self.probs.expand(torch.Size(batch_shape) + self.event_shape))
+
+    def sample(self, sample_shape=torch.Size()):
+        shape = self._extended_shape(sample_shape)
+        n_categories = self.event_shape[0]
+        with torch.no_grad():
+            probs = self.probs.expand(shape).reshape(-1, n_categories)
+            indices = torch.multinomial(probs, 1).squeeze(-1)
+            return F.one_hot(indices, n_categories).to(self.probs.dtype).reshape(shape)
+
+    def log_prob(self, value):
+        if self._validate_args:
+            self._validate_sample(value)
+        return (value * self.logits).sum(-1)
+
+    def entropy(self):
+        return -(self.probs * self.logits).sum(-1)
+
+
+class FastLaplace(DistributionTorch):
+    r"""Lightweight Laplace distribution computed directly from :attr:`loc` and :attr:`scale`.
+
+    This class can be used in place of :class:`torch.distributions.Laplace`.
+
+    Examples
+    --------
+    >>> from torch.distributions import Laplace as LaplaceTorch
+    >>> loc, scale = torch.randn(2, 3), torch.rand(2, 3) + 0.5
+    >>> p, p_torch = FastLaplace(loc, scale), LaplaceTorch(loc, scale)
+    >>> x = torch.randn(2, 3)
+    >>> torch.allclose(p.log_prob(x), p_torch.log_prob(x))
+    True
+    >>> torch.allclose(p.entropy(), p_torch.entropy())
+    True
+    """
+    arg_constraints = {"loc": constraints.real, "scale": constraints.positive}
+    support = constraints.real
+    has_rsample = True
+
+    def __init__(self, loc, scale, validate_args=None):
+        if loc.shape != scale.shape:
+            loc, scale = torch.broadcast_tensors(loc, scale)
+        self.loc = loc
+        self.scale = scale
+        super().__init__(loc.shape, validate_args=bool(validate_args))
+
+    @property
+    def mean(self):
+        return self.loc
+
+    @property
+    def mode(self):
+        return self.loc
+
+    @property
+    def stddev(self):
+        return math.sqrt(2) * self.scale
+
+    @property
+    def variance(self):
+        return 2 * self.scale.pow(2)
+
+    def expand(self, batch_shape, _instance=None):
+        return FastLaplace(self.loc.expand(batch_shape), self.scale.expand(batch_shape))
+
+    def rsample(self, sample_shape=torch.Size()):
+        finfo = torch.finfo(self.loc.dtype)
+        u = torch.empty(self._extended_shape(sample_shape), dtype=self.loc.dtype,
+                        device=self.loc.device).uniform_(finfo.eps - 1, 1)
+        return self.loc - self.scale * u.sign() * (-u.abs()).log1p()
+
+    def sample(self, sample_shape=torch.Size()):
+        with torch.no_grad():
+            return self.rsample(sample_shape)
+
+    def log_prob(self, value):
+        if self._validate_args:
+            self._validate_sample(value)
+        return -(2 * self.scale).log() - (value - self.loc).abs() / self.scale
+
+    def entropy(self):
+        return 1 + (2 * self.scale).log()
+
+
+@register_kl(FastNormal, FastNormal)
+def _kl_fast_normal_fast_normal(p, q):
+    var_ratio = (p.scale / q.scale).pow(2)
+    t1 = ((p.loc - q.loc) / q.scale).pow(2)
+    return 0.5 * (var_ratio + t1 - 1 - var_ratio.log())
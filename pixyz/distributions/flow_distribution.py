@@ -3,6 +3,16 @@ from ..distributions import Distribution
 from ..utils import get_dict_values
 
 
+def _fold_sample_shape(x, sample_shape):
+    """Fold sample_shape into the batch axis, (sample_shape, n_batch, ...) -> (sample_shape * n_batch, ...)."""
+    return x.reshape((-1,) + x.shape[len(sample_shape) + 1:])
+
+
+def _unfold_sample_shape(x, batch_shape):
+    """Unfold the batch axis into batch_shape, (sample_shape * n_batch, ...) -> (sample_shape, n_batch, ...)."""
+    return x.reshape(batch_shape + x.shape[1:])
+
+
 class TransformedDistribution(Distribution):
     r"""
     Convert flow transformations to distributions.
@@ -15,6 +25,16 @@ class TransformedDistribution(Distribution):
 
 
     Once initializing, it can be handled as a distribution module.
+    If only :math:`z` is given to :meth:`get_log_prob`, :math:`x` is computed by the inverse of the flow.
+
+    Examples
+    --------
+    >>> from pixyz.distributions import Normal
+    >>> from pixyz.flows import PlanarFlow
+    >>> prior = Normal(loc=torch.tensor(0.), scale=torch.tensor(1.), var=["x"], features_shape=[2])
+    >>> p = TransformedDistribution(prior, PlanarFlow(2, constraint_u=True), var=["z"])
+    >>> p.get_log_prob({"z": torch.randn(3, 2)}).shape
+    torch.Size([3])
 
     """
 
@@ -42,7 +62,7 @@ class TransformedDistribution(Distribution):
     @property
     def prob_factorized_text(self):
         flow_text = "{}=f_{{flow}}({})".format(self.var[0], self.flow_input_var[0])
-        prob_text = "{}({})".format(self._name, flow_text)
+        prob_text = "{}({})".format(self.name, flow_text)
 
         return prob_text
 
@@ -60,11 +80,19 @@ class TransformedDistribution(Distribution):
     def sample(self, x_dict={}, batch_n=None, sample_shape=torch.Size(), return_all=True, reparam=False,
                compute_jacobian=True):
         # sample from the prior
+        sample_shape = torch.Size(sample_shape)
         sample_dict = self.prior.sample(x_dict, batch_n=batch_n, sample_shape=sample_shape, return_all=return_all)
 
-        # flow transformation
+        # flow transformation, where sample_shape is folded into the batch axis.
         _x = get_dict_values(sample_dict, self.flow_input_var)[0]
-        z = self.forward(_x, compute_jacobian=compute_jacobian)
+        if len(sample_shape) > 0:
+            batch_shape = _x.shape[:len(sample_shape) + 1]
+            z = _unfold_sample_shape(self.forward(_fold_sample_shape(_x, sample_shape),
+                                                  compute_jacobian=compute_jacobian), batch_shape)
+            if compute_jacobian:
+                self.flow._logdet_jacobian = self.flow._logdet_jacobian.reshape(batch_shape)
+        else:
+            z = self.forward(_x, compute_jacobian=compute_jacobian)
         output_dict = {self.var[0]: z}
 
         if return_all:
@@ -74,15 +102,55 @@ class TransformedDistribution(Distribution):
         return output_dict
 
     def get_log_prob(self, x_dict, sum_features=True, feature_dims=None, compute_jacobian=False):
+        if self.flow_input_var[0] not in x_dict:
+            # evaluate the density at given outputs by the inverse flow transformation.
+            x_dict = dict(x_dict)
+            x_dict[self.flow_input_var[0]] = self.inverse(get_dict_values(x_dict, self.var)[0])
+            compute_jacobian = True
+
         # prior
         log_prob_prior = self.prior.get_log_prob(x_dict, sum_features=sum_features, feature_dims=feature_dims)
 
         # flow
         if compute_jacobian:
-            self.sample(x_dict, return_all=False, compute_jacobian=True)
+            self.forward(get_dict_values(x_dict, self.flow_input_var)[0], compute_jacobian=True)
 
         return log_prob_prior - self.logdet_jacobian
 
+    def sample_mean(self, x_dict={}):
+        """Return the plug-in estimate of the mean, i.e., the transformation of the mean of the prior.
+
+        Note that this is not equal to the mean of this distribution unless the flow is affine.
+
+        Parameters
+        ----------
+        x_dict : :obj:`dict`, defaults to {}
+            Input variables.
+
+        Returns
+        -------
+        torch.Tensor
+
+        """
+        _x = self.prior.sample_mean(get_dict_values(x_dict, self.prior.input_var, return_dict=True))
+        return self.forward(_x, compute_jacobian=False)
+
+    def sample_mode(self, x_dict={}):
+        """Return the plug-in estimate of the mode, i.e., the transformation of the mode of the prior.
+
+        Parameters
+        ----------
+        x_dict : :obj:`dict`, defaults to {}
+            Input variables.
+
+        Returns
+        -------
+        torch.Tensor
+
+        """
+        _x = self.prior.sample_mode(get_dict_values(x_dict, self.prior.input_var, return_dict=True))
+        return self.forward(_x, compute_jacobian=False)
+
     def forward(self, x, y=None, compute_jacobian=True):
         """
         Forward propagation of flow layers.
@@ -170,7 +238,7 @@ class InverseTransformedDistribution(Distribution):
     def prob_factorized_text(self):
         var_text = ','.join(self.flow_output_var + self.cond_var)
         flow_text = "{}=f^{{-1}}_{{flow}}({})".format(self.var[0], var_text)
-        prob_text = "{}({})".format(self._name, flow_text)
+        prob_text = "{}({})".format(self.name, flow_text)
 
         return prob_text
 
@@ -187,16 +255,28 @@ class InverseTransformedDistribution(Distribution):
 
     def sample(self, x_dict={}, batch_n=None, sample_shape=torch.Size(), return_all=True, reparam=False):
         # sample from the prior
+        sample_shape = torch.Size(sample_shape)
         sample_dict = self.prior.sample(x_dict, batch_n=batch_n, sample_shape=sample_shape, return_all=return_all)
 
         # inverse flow transformation
-        _z = get_dict_values(sample_dict, self.flow_output_var)
+        _z = get_dict_values(sample_dict, self.flow_output_var)[0]
         _y = get_dict_values(sample_dict, self.cond_var)
+        _y = _y[0] if len(_y) > 0 else None
 
-        if len(_y) == 0:
-            x = self.inverse(_z[0])
+        if len(sample_shape) > 0:
+            # fold sample_shape into the batch axis, where the conditional variable is broadcast by expand views.
+            batch_shape = _z.shape[:len(sample_shape) + 1]
+            _z = _fold_sample_shape(_z, sample_shape)
+            if _y is not None:
+                _y = _fold_sample_shape(_y.expand(sample_shape + _y.shape), sample_shape)
+
+        if _y is None:
+            x = self.inverse(_z)
         else:
-            x = self.inverse(_z[0], y=_y[0])
+            x = self.inverse(_z, y=_y)
+
+        if len(sample_shape) > 0:
+            x = _unfold_sample_shape(x, batch_shape)
 
         output_dict = {self.var[0]: x}
 
@@ -232,6 +312,46 @@ class InverseTransformedDistribution(Distribution):
 
         return log_prob_prior + self.logdet_jacobian
 
+    def _inverse_point_estimate(self, _z, x_dict):
+        _y = get_dict_values(x_dict, self.cond_var)
+        if len(_y) == 0:
+            return self.inverse(_z)
+        return self.inverse(_z, y=_y[0])
+
+    def sample_mean(self, x_dict={}):
+        """Return the plug-in estimate of the mean, i.e., the inverse transformation of the mean of the prior.
+
+        Note that this is not equal to the mean of this distribution unless the flow is affine.
+
+        Parameters
+        ----------
+        x_dict : :obj:`dict`, defaults to {}
+            Input variables.
+
+        Returns
+        -------
+        torch.Tensor
+
+        """
+        _z = self.prior.sample_mean(get_dict_values(x_dict, self.prior.input_var, return_dict=True))
+        return self._inverse_point_estimate(_z, x_dict)
+
+    def sample_mode(self, x_dict={}):
+        """Return the plug-in estimate of the mode, i.e., the inverse transformation of the mode of the prior.
+
+        Parameters
+        ----------
+        x_dict : :obj:`dict`, defaults to {}
+            Input variables.
+
+        Returns
+        -------
+        torch.Tensor
+
+        """
+        _z = self.prior.sample_mode(get_dict_values(x_dict, self.prior.input_var, return_dict=True))
+        return self._inverse_point_estimate(_z, x_dict)
+
     def forward(self, x, y=None, compute_jacobian=True):
         """
         Forward propagation of flow layers.
@@ -1,8 +1,9 @@
+import warnings
 import torch
 from torch import nn
 
-from ..distributions.distributions import Distribution
-from ..utils import convert_latex_name
+from ..distributions.distributions import Distribution, DistributionBase
+from ..utils import convert_latex_name, get_dict_values
 
 
 class MixtureModel(Distribution):
@@ -59,6 +60,9 @@ class MixtureModel(Distribution):
           (probs): torch.Size([1, 3])
         )
       )
+    >>> samples = p.sample(batch_n=4, sample_shape=(5,), return_hidden=True)
+    >>> samples["x"].shape, samples["z"].shape
+    (torch.Size([5, 4, 2]), torch.Size([5, 4, 3]))
     """
 
     def __init__(self, distributions, prior, name="p"):
@@ -99,7 +103,12 @@ class MixtureModel(Distribution):
 
         hidden_var = prior.var
 
-        super().__init__(var=var_list, name=name)
+        # conditional components (and prior) share the union of their conditional variables.
+        cond_var = []
+        for d in list(distributions) + [prior]:
+            cond_var += [var for var in d.cond_var if var not in cond_var]
+
+        super().__init__(var=var_list, cond_var=cond_var, name=name)
 
         self.distributions = distributions
         self.prior = prior
@@ -114,7 +123,7 @@ class MixtureModel(Distribution):
     @property
     def prob_text(self):
         _prob_text = "{}({})".format(
-            self._name, ','.join(([convert_latex_name(var_name) for var_name in self._var]))
+            self.name, ','.join(([convert_latex_name(var_name) for var_name in self._var]))
         )
 
         return _prob_text
@@ -139,22 +148,136 @@ class MixtureModel(Distribution):
     def posterior(self, name=None):
         return PosteriorMixtureModel(self, name=name)
 
-    def sample(self, batch_n=None, sample_shape=torch.Size(), return_hidden=False, **kwargs):
-        # sample from prior
-        hidden_output = self.prior.sample(batch_n=batch_n)[self._hidden_var[0]]
-
-        var_output = []
-        for _hidden_output in hidden_output:
-            var_output.append(self.distributions[_hidden_output.argmax(dim=-1)].sample()[self._var[0]])
+    def _can_stack_components(self):
+        """Whether all components are unconditional distributions of the same family with the same shape,
+        so that their parameters can be stacked.
+
+        Components without `features_shape` are excluded, since the shape of their parameters is unknown."""
+        d_0 = self.distributions[0]
+        if not isinstance(d_0, DistributionBase) or hasattr(d_0, "relaxed_distribution_torch_class"):
+            return False
+        if len(d_0.features_shape) == 0:
+            return False
+        if type(d_0).set_dist is not DistributionBase.set_dist or \
+                type(d_0).get_sample is not DistributionBase.get_sample:
+            return False
+        return all(type(d) is type(d_0) and len(d.cond_var) == 0 and d.features_shape == d_0.features_shape
+                   for d in self.distributions)
+
+    def _sample_stacked(self, index, reparam=False):
+        """Draw samples from all components at once with parameters gathered by `index`."""
+        params = {}
+        for key in self.distributions[0].params_keys:
+            # (num_mix, *features_shape)
+            stacked_param = torch.cat([d.get_params()[key] for d in self.distributions], dim=0)
+            params[key] = stacked_param[index]
+
+        d_0 = self.distributions[0]
+        dist = d_0._create_dist(d_0.distribution_torch_class, **params)
+        if reparam:
+            return dist.rsample()
+        return dist.sample()
+
+    def _sample_per_component(self, x_dict, index, batch_n, reparam=False):
+        """Draw samples from each component by the number of its assignments and scatter them in order."""
+        flat_index = index.reshape(-1)
+        rows_list = []
+        samples_list = []
+        for i, d in enumerate(self.distributions):
+            rows = (flat_index == i).nonzero(as_tuple=False).squeeze(-1)
+            if rows.numel() == 0:
+                continue
+
+            if len(d.cond_var) != 0:
+                # rows of inputs corresponding to the assigned samples
+                batch_index = rows % batch_n
+                input_dict = {var: value[batch_index] for var, value in
+                              get_dict_values(x_dict, d.cond_var, return_dict=True).items()}
+                samples = d.sample(input_dict, return_all=False, reparam=reparam)[self._var[0]]
+            else:
+                samples = d.sample(batch_n=rows.numel(), return_all=False, reparam=reparam)[self._var[0]]
+
+            rows_list.append(rows)
+            samples_list.append(samples)
+
+        rows = torch.cat(rows_list)
+        samples = torch.cat(samples_list)
+        output = samples.new_empty((flat_index.shape[0],) + samples.shape[1:])
+        output = output.index_copy(0, rows, samples)
+        return output.reshape(index.shape + samples.shape[1:])
+
+    def sample(self, x_dict={}, batch_n=None, sample_shape=torch.Size(), return_all=True, reparam=False,
+               return_hidden=False, **kwargs):
+        if isinstance(x_dict, int) and not isinstance(x_dict, bool):
+            # the former signature was sample(batch_n=None, sample_shape=torch.Size(), return_hidden=False).
+            warnings.warn("Passing batch_n as the first positional argument of MixtureModel.sample is deprecated. "
+                          "Use sample(batch_n=...) instead.", DeprecationWarning, stacklevel=2)
+            if isinstance(sample_shape, bool):
+                return_hidden = sample_shape
+                sample_shape = torch.Size()
+            if batch_n is not None:
+                sample_shape = batch_n
+            x_dict, batch_n = {}, x_dict
+
+        x_dict = self._check_input(x_dict)
+
+        if batch_n is None and len(self.cond_var) != 0:
+            batch_n = get_dict_values(x_dict, self.cond_var)[0].shape[0]
+
+        # sample from prior: (sample_shape, batch_n, num_mix)
+        prior_input_dict = get_dict_values(x_dict, self.prior.cond_var, return_dict=True)
+        hidden_output = self.prior.sample(prior_input_dict, batch_n=batch_n, sample_shape=sample_shape,
+                                          return_all=False)[self._hidden_var[0]]
+        index = hidden_output.argmax(dim=-1)
+
+        if self._can_stack_components():
+            var_output = self._sample_stacked(index, reparam=reparam)
+        else:
+            var_output = self._sample_per_component(x_dict, index, index.shape[-1], reparam=reparam)
 
-        var_output = torch.cat(var_output, dim=0)
         output_dict = {self._var[0]: var_output}
 
         if return_hidden:
             output_dict.update({self._hidden_var[0]: hidden_output})
 
+        if return_all:
+            x_dict.update(output_dict)
+            return x_dict
+
         return output_dict
 
+    def _get_log_joint(self, x_dict):
+        """Evaluate log p(x, z=i) of all components as a (num_mix, batch_size) tensor."""
+        num_mix = len(self.distributions)
+        x = x_dict[self._var[0]]
+
+        if self._can_stack_components():
+            # p(x|z=i) of all components by a single distribution with the batch shape of (num_mix, batch_size)
+            features_shape = self.distributions[0].features_shape
+            n_batch_dims = x.dim() - len(features_shape)
+            params = {}
+            for key in self.distributions[0].params_keys:
+                stacked_param = torch.cat([d.get_params()[key] for d in self.distributions], dim=0)
+                params[key] = stacked_param.reshape((num_mix,) + (1,) * n_batch_dims + features_shape)
+
+            d_0 = self.distributions[0]
+            log_prob = d_0._create_dist(d_0.distribution_torch_class, **params).log_prob(x)
+            if len(features_shape) > 0:
+                log_prob = torch.sum(log_prob, dim=tuple(range(n_batch_dims + 1, log_prob.dim())))
+        else:
+            log_prob = torch.stack([d.get_log_prob(x_dict) for d in self.distributions], dim=0)
+
+        # p(z=i) for all i
+        prior_input_dict = get_dict_values(x_dict, self.prior.cond_var, return_dict=True)
+        probs = self.prior.get_params(prior_input_dict)["probs"]  # (1 or batch_size, num_mix)
+        prior_log_prob = torch.log_softmax(torch.log(probs.clamp(min=torch.finfo(probs.dtype).tiny)), dim=-1)
+        if len(self.prior.cond_var) == 0:
+            prior_log_prob = prior_log_prob[0].reshape((num_mix,) + (1,) * (log_prob.dim() - 1))
+        else:
+            prior_log_prob = prior_log_prob.transpose(0, -1)
+
+        return log_prob + prior_log_prob
+
     def get_log_prob(self, x_dict, return_hidden=False, **kwargs):
         """Evaluate log-pdf, log p(x) (if return_hidden=False) or log p(x, z) (if return_hidden=True).
 
@@ -180,20 +303,8 @@ class MixtureModel(Distribution):
 
         """
 
-        log_prob_all = []
-
-        _device = x_dict[self._var[0]].device
-        eye_tensor = torch.eye(len(self.distributions)).to(_device)  # for prior
-
-        for i, d in enumerate(self.distributions):
-            # p(z=i)
-            prior_log_prob = self.prior.log_prob().eval({self._hidden_var[0]: eye_tensor[i]})
-            # p(x|z=i)
-            log_prob = d.log_prob().eval(x_dict)
-            # p(x, z=i)
-            log_prob_all.append(log_prob + prior_log_prob)
-
-        log_prob_all = torch.stack(log_prob_all, dim=0)  # (num_mix, batch_size)
+        # p(x, z=i) for all i
+        log_prob_all = self._get_log_joint(x_dict)  # (num_mix, batch_size)
 
         if return_hidden:
             return log_prob_all
@@ -218,14 +329,14 @@ class PosteriorMixtureModel(Distribution):
     @property
     def prob_text(self):
         _prob_text = "{}({}|{})".format(
-            self._name, convert_latex_name(self._hidden_var[0]), convert_latex_name(self._var[0])
+            self.name, convert_latex_name(self._hidden_var[0]), convert_latex_name(self._var[0])
         )
         return _prob_text
 
     @property
     def prob_factorized_text(self):
-        numinator = "{" + "{}({},{})".format(self._name, self._hidden_var[0], self._var[0]) + "}"
-        denominator = "{" + "{}({})".format(self._name, self._var[0]) + "}"
+        numinator = "{" + "{}({},{})".format(self.name, self._hidden_var[0], self._var[0]) + "}"
+        denominator = "{" + "{}({})".format(self.name, self._var[0]) + "}"
 
         _prob_text = "\\frac{}{}".format(numinator, denominator)
 
@@ -240,5 +351,6 @@ class PosteriorMixtureModel(Distribution):
 
     def get_log_prob(self, x_dict, **kwargs):
         # log p(z|x) = log p(x, z) - log p(x)
-        log_prob = self.p.get_log_prob(x_dict, return_hidden=True) - self.p.get_log_prob(x_dict)
+        log_prob_all = self.p.get_log_prob(x_dict, return_hidden=True)
+        log_prob = log_prob_all - torch.logsumexp(log_prob_all, 0)
         return log_prob  # (num_mix, batch_size)
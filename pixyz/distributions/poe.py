@@ -64,6 +64,15 @@ class ProductOfNormal(Normal):
     >>> pon.sample()  # same as sampling from unit Gaussian. # doctest: +SKIP
     {'z': tensor(-0.4494)}
 
+    The log-likelihood is evaluated with the fused parameters of specified experts.
+
+    >>> from pixyz.distributions import Normal
+    >>> p_x = Normal(loc="x", scale=torch.tensor(1.), var=["z"], cond_var=["x"], features_shape=[2])
+    >>> p_y = Normal(loc="y", scale=torch.tensor(1.), var=["z"], cond_var=["y"], features_shape=[2])
+    >>> pon = ProductOfNormal([p_x, p_y])
+    >>> pon.get_log_prob({"x": torch.zeros(1, 2), "z": torch.zeros(1, 2)}).shape
+    torch.Size([1])
+
     """
 
     def __init__(self, p=[], name="p", features_shape=torch.Size()):
@@ -121,12 +130,45 @@ class ProductOfNormal(Normal):
             prob_text = "{} \\propto {}".format(self.prob_text, self.prob_factorized_text)
         return prob_text
 
-    def _get_expert_params(self, params_dict={}, **kwargs):
+    @staticmethod
+    def _get_expert_mask(masks, cond_var):
+        """Get the availability of an expert for each example, which requires all of its conditional variables.
+
+        Parameters
+        ----------
+        masks : :obj:`dict` or :obj:`NoneType`
+        cond_var : list
+
+        Returns
+        -------
+        :obj:`torch.Tensor` or :obj:`NoneType`
+            Boolean tensor of the size of batch, or None if all examples are available.
+
+        """
+        if not masks:
+            return None
+
+        expert_mask = None
+        for var in cond_var:
+            if var in masks:
+                mask = masks[var].bool()
+                expert_mask = mask if expert_mask is None else expert_mask & mask
+        return expert_mask
+
+    @staticmethod
+    def _mask_params(params, mask):
+        """Set zero to parameters of unavailable examples, which means that the expert is not specified."""
+        mask = mask.reshape(mask.shape + (1,) * (params.dim() - mask.dim()))
+        return torch.where(mask, params, params.new_zeros(()))
+
+    def _get_expert_params(self, params_dict={}, masks=None, **kwargs):
         """Get the output parameters of all experts.
 
         Parameters
         ----------
         params_dict : dict
+        masks : :obj:`dict` or :obj:`NoneType`, defaults to None
+            Availability of experts for each example. See :meth:`get_params`.
         **kwargs
             Arbitrary keyword arguments.
 
@@ -139,22 +181,61 @@ class ProductOfNormal(Normal):
         loc = []
         scale = []
 
-        for _p in self.p:
+        experts = self.p if isinstance(self.p, nn.ModuleList) else [self.p]
+        for _p in experts:
             inputs_dict = get_dict_values(params_dict, _p.cond_var, True)
             if len(inputs_dict) != 0:
                 outputs = _p.get_params(inputs_dict, **kwargs)
-                loc.append(outputs["loc"])
-                scale.append(outputs["scale"])
+                _loc, _scale = torch.broadcast_tensors(outputs["loc"], outputs["scale"])
+
+                expert_mask = self._get_expert_mask(masks, _p.cond_var)
+                if expert_mask is not None:
+                    _loc = self._mask_params(_loc, expert_mask)
+                    _scale = self._mask_params(_scale, expert_mask)
+
+                loc.append(_loc)
+                scale.append(_scale)
 
         loc = torch.stack(loc)
         scale = torch.stack(scale)
 
         return loc, scale
 
-    def get_params(self, params_dict={}, **kwargs):
+    def get_params(self, params_dict={}, masks=None, **kwargs):
+        """Get the parameters of the product of specified experts.
+
+        Parameters
+        ----------
+        params_dict : dict
+            Inputs of experts. Experts whose inputs are not given are not specified.
+        masks : :obj:`dict` or :obj:`NoneType`, defaults to None
+            Availability of inputs for each example, given as `{cond_var: bool tensor of the size of batch}`.
+            Experts are not specified for examples where any of their inputs is unavailable,
+            so that batches with different missing inputs for each example can be evaluated at once.
+            Values of unavailable inputs are ignored, but they must be finite.
+            This can also be passed to :meth:`sample`, :meth:`get_log_prob` and :meth:`set_dist`.
+        **kwargs
+            Arbitrary keyword arguments.
+
+        Returns
+        -------
+        dict
+
+        Examples
+        --------
+        >>> from pixyz.distributions import Normal
+        >>> p_x = Normal(loc="x", scale=torch.tensor(1.), var=["z"], cond_var=["x"], features_shape=[1])
+        >>> p_y = Normal(loc="y", scale=torch.tensor(1.), var=["z"], cond_var=["y"], features_shape=[1])
+        >>> pon = ProductOfNormal([p_x, p_y])
+        >>> x, y = torch.tensor([[1.], [1.]]), torch.tensor([[2.], [0.]])
+        >>> pon.get_params({"x": x, "y": y}, masks={"y": torch.tensor([True, False])})["loc"]
+        tensor([[1.0000],
+                [0.5000]])
+
+        """
         # experts
         if len(params_dict) > 0:
-            loc, scale = self._get_expert_params(params_dict, **kwargs)  # (n_expert, n_batch, output_dim)
+            loc, scale = self._get_expert_params(params_dict, masks=masks, **kwargs)  # (n_expert, n_batch, output_dim)
         else:
             loc = torch.zeros(1)
             scale = torch.zeros(1)
@@ -190,16 +271,15 @@ class ProductOfNormal(Normal):
         # parameter for prior
         prior_prec = 1  # prior_loc is not specified because it is equal to 0.
 
-        # compute the diagonal precision matrix.
-        prec = torch.zeros_like(scale).type(scale.dtype)
-        prec[scale != 0] = 1. / scale[scale != 0]
+        # compute the diagonal precision matrix. Unspecified experts (scale = 0) are replaced with
+        # the infinite scale, whose precision is 0, so that neither masked copies nor NaN gradients are produced.
+        prec = torch.where(scale != 0, scale, scale.new_tensor(float("inf"))).reciprocal_()
 
         # compute the square root of a diagonal covariance matrix for the product of distributions.
-        output_prec = torch.sum(prec, dim=0) + prior_prec
-        output_variance = 1. / output_prec   # (n_batch, output_dim)
+        output_variance = torch.sum(prec, dim=0).add_(prior_prec).reciprocal_()   # (n_batch, output_dim)
 
-        # compute the mean vectors for the product of normal distributions.
-        output_loc = torch.sum(prec * loc, dim=0)   # (n_batch, output_dim)
+        # compute the mean vectors for the product of normal distributions by a single reduction over experts.
+        output_loc = torch.einsum("e...,e...->...", prec, loc)   # (n_batch, output_dim)
         output_loc = output_loc * output_variance
 
         return output_loc, torch.sqrt(output_variance)
@@ -208,14 +288,14 @@ class ProductOfNormal(Normal):
         if var is None:
             var = self.input_var
 
-        if type(x) is torch.Tensor:
+        if isinstance(x, torch.Tensor):
             checked_x = {var[0]: x}
 
-        elif type(x) is list:
+        elif isinstance(x, list):
             # TODO: we need to check if all the elements contained in this list are torch.Tensor.
             checked_x = dict(zip(var, x))
 
-        elif type(x) is dict:
+        elif isinstance(x, dict):
             # point of modification
             checked_x = x
 
@@ -224,15 +304,6 @@ class ProductOfNormal(Normal):
 
         return checked_x
 
-    def log_prob(self, sum_features=True, feature_dims=None):
-        raise NotImplementedError()
-
-    def prob(self, sum_features=True, feature_dims=None):
-        raise NotImplementedError()
-
-    def get_log_prob(self, x_dict, sum_features=True, feature_dims=None):
-        raise NotImplementedError()
-
 
 class ElementWiseProductOfNormal(ProductOfNormal):
     r"""Product of normal distributions.
@@ -310,15 +381,15 @@ class ElementWiseProductOfNormal(ProductOfNormal):
         if var is None:
             var = self.input_var
 
-        if type(x) is torch.Tensor:
+        if isinstance(x, torch.Tensor):
             checked_x = {var[0]: x}
 
-        elif type(x) is list:
+        elif isinstance(x, list):
             # TODO: we need to check if all the elements contained in this list are torch.Tensor.
             checked_x = dict(zip(var, x))
 
-        elif type(x) is dict:
-            if not (set(list(x.keys())) >= set(var)):
+        elif isinstance(x, dict):
+            if not all(key in x for key in var):
                 raise ValueError("Input keys are not valid.")
             checked_x = x
 
@@ -327,75 +398,14 @@ class ElementWiseProductOfNormal(ProductOfNormal):
 
         return checked_x
 
-    @staticmethod
-    def _get_mask(inputs, index):
-        """Get a mask to the input to specify an expert identified by index.
-
-        Parameters
-        ----------
-        inputs : torch.Tensor
-        index : int
-
-        Returns
-        -------
-        torch.Tensor
-
-        """
-        mask = torch.zeros_like(inputs).type(inputs.dtype)
-        mask[:, index] = 1
-        return mask
-
-    def _get_params_with_masking(self, inputs, index, **kwargs):
-        """Get the output parameters of the index-specified expert.
-
-        Parameters
-        ----------
-        inputs : torch.Tensor
-        index : int
-        **kwargs
-            Arbitrary keyword arguments.
-        Returns
-        -------
-        outputs : torch.Tensor
-
-        Examples
-        --------
-        >>> # pon = ElementWiseProductOfNormal(p)
-        >>> # a = torch.tensor([[1, 0, 0], [0, 1, 0]])
-        >>> # pon._get_params_with_masking(a, 0)
-        tensor([[[0.01, 0.0131],
-                 [0, 0]],  # loc
-                [[0.42, 0.39],
-                 [1, 1]],  # scale
-               ])
-        >>> # pon._get_params_with_masking(a, 1)
-        tensor([[[0, 0],
-                 [0.021, 0.11]],  # loc
-                [[1, 1],
-                 [0.293, 0.415]],  # scale
-               ])
-        >>> # self._get_params_with_masking(a, 2)
-        tensor([[[0, 0],
-                 [0, 0]],  # loc
-                [[1, 1],
-                 [1, 1]],  # scale
-               ])
-
-        """
-        mask = self._get_mask(inputs, index)  # (n_batch, n_expert)
-        outputs_dict = self.p.get_params({self.cond_var[0]: inputs * mask}, **kwargs)
-        outputs = torch.stack([outputs_dict["loc"], outputs_dict["scale"]])  # (2, n_batch, output_dim)
-
-        # When the index-th expert in the output examples is not specified, set zero to them.
-        outputs[:, inputs[:, index] == 0, :] = 0
-        return outputs
-
-    def _get_expert_params(self, params_dict={}, **kwargs):
+    def _get_expert_params(self, params_dict={}, masks=None, **kwargs):
         """Get the output parameters of all experts.
 
         Parameters
         ----------
         params_dict : dict
+        masks : :obj:`dict` or :obj:`NoneType`, defaults to None
+            Availability of the input for each example. See :meth:`ProductOfNormal.get_params`.
         **kwargs
             Arbitrary keyword arguments.
 
@@ -407,9 +417,36 @@ class ElementWiseProductOfNormal(ProductOfNormal):
         """
         inputs = get_dict_values(params_dict, self.cond_var)[0]  # (n_batch, n_expert=input_dim)
 
-        n_expert = inputs.size()[1]
+        n_batch, n_expert = inputs.size()
+
+        specified = inputs != 0
+        input_mask = self._get_expert_mask(masks, self.cond_var)
+        if input_mask is not None:
+            specified = specified & input_mask.unsqueeze(-1)
+
+        # pairs of (expert, example) where the expert is specified.
+        expert_index, batch_index = specified.t().nonzero(as_tuple=True)
+
+        if expert_index.numel() == 0:
+            # no expert is specified, so the network is not run (the output is the prior).
+            # if the shape of outputs is unknown, they are broadcast over features.
+            features_shape = self.features_shape or self.p.features_shape or torch.Size([1])
+            zeros = inputs.new_zeros((n_expert, n_batch) + features_shape)
+            return zeros, zeros
+
+        # input for the index-th expert only retains the index-th element: (n_specified, input_dim)
+        masks = nn.functional.one_hot(expert_index, n_expert).type(inputs.dtype)
+        masked_inputs = inputs[batch_index] * masks
+
+        # run all specified experts in a single forward.
+        outputs_dict = self.p.get_params({self.cond_var[0]: masked_inputs}, **kwargs)
 
-        outputs = [self._get_params_with_masking(inputs, i) for i in range(n_expert)]
-        outputs = torch.stack(outputs)  # (n_expert, 2, n_batch, output_dim)
+        # parameters of unspecified experts are set to zero.
+        outputs = []
+        for key in ["loc", "scale"]:
+            output = outputs_dict[key]  # (n_specified, output_dim)
+            output = output.new_zeros((n_expert, n_batch) + output.shape[1:]).index_put(
+                (expert_index, batch_index), output)
+            outputs.append(output)
 
-        return outputs[:, 0, :, :], outputs[:, 1, :, :]  # (n_expert, n_batch, output_dim)
+        return outputs[0], outputs[1]  # (n_expert, n_batch, output_dim)
@@ -1,7 +1,8 @@
 from __future__ import print_function
+import torch
 
 from .distributions import Distribution
-from ..utils import get_dict_values
+from ..utils import get_dict_values, get_cache_scope
 
 
 class Deterministic(Distribution):
@@ -32,6 +33,33 @@ class Deterministic(Distribution):
     Traceback (most recent call last):
      ...
     NotImplementedError
+
+    A deterministic distribution can be shared by several distributions as an intermediate variable,
+    e.g., a feature extractor :math:`h = f(x)`. Its outputs are reused only within an enabled
+    :class:`pixyz.utils.cache_scope` (in :class:`pixyz.models.Model`, only if `cache_params` is True);
+    otherwise :meth:`forward` is called once for each distribution using it.
+    The intermediate variable of a product can be marginalized to evaluate the log-likelihood.
+
+    >>> from pixyz.distributions import Normal
+    >>> from pixyz.utils import cache_scope
+    >>> class Extractor(Deterministic):
+    ...     def __init__(self):
+    ...         super().__init__(cond_var=["x"], var=["h"], name="f")
+    ...         self.model = torch.nn.Linear(4, 4)
+    ...     def forward(self, x):
+    ...         return {"h": self.model(x)}
+    >>> f = Extractor()
+    >>> q_z = Normal(loc="h", scale=torch.tensor(1.), var=["z"], cond_var=["h"], features_shape=[4], name="q")
+    >>> q_y = Normal(loc="h", scale=torch.tensor(1.), var=["y"], cond_var=["h"], features_shape=[4], name="q")
+    >>> q = (q_z * q_y * f).marginalize_var("h")
+    >>> print(q.prob_factorized_text)
+    \\int q(z|h)q(y|h)f(h|x)dh
+    >>> x_dict = {"x": torch.randn(2, 4), "y": torch.randn(2, 4), "z": torch.randn(2, 4)}
+    >>> with cache_scope() as cache:
+    ...     log_prob = q.get_log_prob(x_dict)
+    ...     samples = q.sample({"x": x_dict["x"]})
+    >>> cache.hits, cache.misses
+    (3, 3)
     """
 
     def __init__(self, **kwargs):
@@ -41,14 +69,25 @@ class Deterministic(Distribution):
     def distribution_name(self):
         return "Deterministic"
 
-    def sample(self, x_dict={}, return_all=True, **kwargs):
+    def sample(self, x_dict={}, return_all=True, sample_shape=torch.Size(), **kwargs):
         x_dict = self._check_input(x_dict)
         _x_dict = get_dict_values(x_dict, self.input_var, return_dict=True)
-        output_dict = self.forward(**_x_dict)
+
+        # outputs are reused by all distributions sharing this distribution within cache_scope.
+        cache = get_cache_scope()
+        if cache is not None:
+            output_dict = cache.memoize(self, _x_dict, lambda: self.forward(**_x_dict))
+        else:
+            output_dict = self.forward(**_x_dict)
 
         if set(output_dict.keys()) != set(self._var):
             raise ValueError("Output variables are not the same as `var`.")
 
+        # outputs are identical for all samples, so they are broadcast by expand views.
+        sample_shape = torch.Size(sample_shape)
+        if len(sample_shape) > 0:
+            output_dict = {var: value.expand(sample_shape + value.shape) for var, value in output_dict.items()}
+
         if return_all:
             x_dict.update(output_dict)
             return x_dict
@@ -58,6 +97,12 @@ class Deterministic(Distribution):
     def sample_mean(self, x_dict):
         return self.sample(x_dict, return_all=False)[self._var[0]]
 
+    def sample_mode(self, x_dict):
+        return self.sample_mean(x_dict)
+
+    def _get_point_estimate(self, x_dict={}, mode=False):
+        return self.sample(x_dict, return_all=False)
+
 
 class DataDistribution(Distribution):
     """
@@ -87,13 +132,22 @@ class DataDistribution(Distribution):
     def distribution_name(self):
         return "Data distribution"
 
-    def sample(self, x_dict={}, **kwargs):
+    def sample(self, x_dict={}, sample_shape=torch.Size(), **kwargs):
         output_dict = self._check_input(x_dict)
+
+        sample_shape = torch.Size(sample_shape)
+        if len(sample_shape) > 0:
+            for var in self._var:
+                output_dict[var] = output_dict[var].expand(sample_shape + output_dict[var].shape)
+
         return output_dict
 
     def sample_mean(self, x_dict):
         return self.sample(x_dict, return_all=False)[self._var[0]]
 
+    def sample_mode(self, x_dict):
+        return self.sample_mean(x_dict)
+
     @property
     def input_var(self):
         """
@@ -4,7 +4,8 @@ from .flows import (
 )
 
 from .normalizing_flows import (
-    PlanarFlow
+    PlanarFlow,
+    PlanarFlowStack,
 )
 
 from .coupling import (
@@ -35,6 +36,7 @@ __all__ = [
     'Flow',
     'FlowList',
     'PlanarFlow',
+    'PlanarFlowStack',
     'AffineCoupling',
     'ChannelConv',
     'Squeeze',
@@ -3,7 +3,6 @@ from torch import nn
 from torch.nn import functional as F
 
 import numpy as np
-import scipy as sp
 
 from .flows import Flow
 
@@ -12,10 +11,23 @@ class ChannelConv(Flow):
     """
     Invertible 1 × 1 convolution.
 
+    The weight, its inverse and its log-determinant are cached while parameters are not updated
+    (identified by their version counters), unless gradients are computed.
+    If `decomposed` is True, the weight is parameterized by the LU decomposition and inverted by triangular solves.
+
     Notes
     -----
     This is implemented with reference to the following code.
     https://github.com/chaiyujin/glow-pytorch/blob/master/glow/modules.py
+
+    Examples
+    --------
+    >>> f = ChannelConv(4, decomposed=True)
+    >>> x = torch.randn(2, 4, 3, 3)
+    >>> with torch.no_grad():
+    ...     z = f(x)
+    ...     torch.allclose(f.inverse(z), x, atol=1e-5)
+    True
     """
 
     def __init__(self, in_channels, decomposed=False):
@@ -27,7 +39,8 @@ class ChannelConv(Flow):
             self.register_parameter("weight", nn.Parameter(torch.Tensor(w_init)))
         else:
             # LU decomposition
-            np_p, np_l, np_u = sp.linalg.lu(w_init)
+            from scipy import linalg
+            np_p, np_l, np_u = linalg.lu(w_init)
             np_s = np.diag(np_u)
             np_sign_s = np.sign(np_s)
             np_log_s = np.log(np.abs(np_s))
@@ -41,38 +54,63 @@ class ChannelConv(Flow):
             self.l = nn.Parameter(torch.Tensor(np_l.astype(np.float32)))
             self.log_s = nn.Parameter(torch.Tensor(np_log_s.astype(np.float32)))
             self.u = nn.Parameter(torch.Tensor(np_u.astype(np.float32)))
-            self.l_mask = torch.Tensor(l_mask)
-            self.eye = torch.Tensor(eye)
+            # constants are moved with the module, but not saved in state_dict.
+            self.register_buffer('l_mask', torch.Tensor(l_mask), persistent=False)
+            self.register_buffer('eye', torch.Tensor(eye), persistent=False)
         self.w_shape = w_shape
         self.decomposed = decomposed
+        self._cache = {}
 
-    def get_parameters(self, x, inverse):
-        w_shape = self.w_shape
-        pixels = np.prod(x.size()[2:])
-        device = x.device
+    def _get_version(self):
+        """Identify the current values of parameters and buffers by their version counters and storages."""
+        return tuple((tensor._version, tensor.data_ptr()) for tensor in list(self.parameters()) + list(self.buffers()))
 
+    def _get_weight(self, inverse):
+        """Compute the weight (or its inverse) and the log-determinant of the weight.
+
+        Returns
+        -------
+        weight : torch.Tensor
+            (in_channels, in_channels)
+        logdet : torch.Tensor
+            Log-determinant of the weight (not multiplied by the number of pixels).
+
+        """
         if not self.decomposed:
-            logdet_jacobian = torch.slogdet(self.weight.cpu())[1].to(device) * pixels
+            logdet = torch.linalg.slogdet(self.weight)[1]
             if not inverse:
-                weight = self.weight.view(w_shape[0], w_shape[1], 1, 1)
+                weight = self.weight
             else:
-                weight = torch.inverse(self.weight.double()).float().view(w_shape[0], w_shape[1], 1, 1)
-            return weight, logdet_jacobian
+                weight = torch.linalg.inv(self.weight.double()).to(self.weight.dtype)
+            return weight, logdet
+
+        l = self.l * self.l_mask + self.eye
+        u = self.u * self.l_mask.t() + torch.diag(self.sign_s * torch.exp(self.log_s))
+        logdet = torch.sum(self.log_s)
+        if not inverse:
+            weight = torch.matmul(self.p, torch.matmul(l, u))
         else:
-            self.p = self.p.to(device)
-            self.sign_s = self.sign_s.to(device)
-            self.l_mask = self.l_mask.to(device)
-            self.eye = self.eye.to(device)
-            l = self.l * self.l_mask + self.eye
-            u = self.u * self.l_mask.transpose(0, 1).contiguous() + torch.diag(self.sign_s * torch.exp(self.log_s))
-            logdet_jacobian = torch.sum(self.log_s) * pixels
-            if not inverse:
-                w = torch.matmul(self.p, torch.matmul(l, u))
-            else:
-                l = torch.inverse(l.double()).float()
-                u = torch.inverse(u.double()).float()
-                w = torch.matmul(u, torch.matmul(l, self.p.inverse()))
-            return w.view(w_shape[0], w_shape[1], 1, 1), logdet_jacobian
+            # W^{-1} = U^{-1} L^{-1} P^T, where P is a permutation matrix and L is unit lower triangular.
+            weight = torch.linalg.solve_triangular(l, self.p.t(), upper=False, unitriangular=True)
+            weight = torch.linalg.solve_triangular(u, weight, upper=True)
+        return weight, logdet
+
+    def get_parameters(self, x, inverse):
+        pixels = np.prod(x.size()[2:])
+
+        if torch.is_grad_enabled() and any(param.requires_grad for param in self.parameters()):
+            # cached values cannot be reused in different computational graphs.
+            weight, logdet = self._get_weight(inverse)
+        else:
+            # values computed in inference mode are inference tensors, which cannot be saved for backward
+            # outside of it, so they are cached separately.
+            key = (inverse, torch.is_inference_mode_enabled())
+            version = self._get_version()
+            if key not in self._cache or self._cache[key][0] != version:
+                self._cache[key] = (version, self._get_weight(inverse))
+            weight, logdet = self._cache[key][1]
+
+        return weight.view(self.w_shape[0], self.w_shape[1], 1, 1), logdet * pixels
 
     def forward(self, x, y=None, compute_jacobian=True):
         weight, logdet_jacobian = self.get_parameters(x, inverse=False)
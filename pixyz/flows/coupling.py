@@ -16,11 +16,30 @@ class AffineCoupling(Flow):
         \mathbf{y}_{d+1:D} &=& \mathbf{x}_{d+1:D} \odot \exp(s(\mathbf{x}_{1:d})+t(\mathbf{x}_{1:d}))
         \end{eqnarray*}
 
+    The mask is cached as a (non-persistent) buffer, so that it follows the module by :meth:`to`,
+    and it is rebuilt only when the shape of inputs changes.
+
+    If `split` is True (only for the channel-wise mask), inputs are split into the conditioning half
+    :math:`\mathbf{x}_{1:d}` and the other half, and the networks take only the conditioning half
+    and return :math:`s` and :math:`t` of the other half, instead of taking and returning full-size tensors
+    whose masked elements are zeros.
+
+    Examples
+    --------
+    >>> scale_translate_net = lambda x: (torch.tanh(x), x)
+    >>> f = AffineCoupling(4, mask_type="channel_wise", scale_translate_net=scale_translate_net, split=True)
+    >>> x = torch.randn([2,4,3,3])
+    >>> z = f(x)
+    >>> torch.equal(z[:, :2], x[:, :2])
+    True
+    >>> torch.allclose(f.inverse(z), x, atol=1e-6)
+    True
+
     """
 
     def __init__(self, in_features, mask_type="channel_wise",
                  scale_net=None, translate_net=None, scale_translate_net=None,
-                 inverse_mask=False):
+                 inverse_mask=False, split=False):
         super().__init__(in_features)
 
         # mask initializations
@@ -29,7 +48,13 @@ class AffineCoupling(Flow):
         else:
             raise ValueError
 
+        if split and mask_type != "channel_wise":
+            raise ValueError("split is only available for the channel-wise mask.")
+
         self.inverse_mask = inverse_mask
+        self.split = split
+        self.register_buffer("mask", None, persistent=False)
+        self._mask_size = None
 
         self.scale_net = None
         self.translate_net = None
@@ -78,23 +103,62 @@ class AffineCoupling(Flow):
                   [0., 1., 0., 1., 0.]]]])
 
         """
+        if self.mask is None or self._mask_size != x.shape[1:] or \
+                self.mask.device != x.device or self.mask.dtype != x.dtype:
+            self.mask = self._build_mask(x).to(device=x.device, dtype=x.dtype)
+            self._mask_size = x.shape[1:]
+        return self.mask
+
+    def _build_mask(self, x):
         if x.dim() == 4:
             [_, channels, height, width] = x.shape
             if self.mask_type == "checkerboard":
                 mask = checkerboard_mask(height, width, self.inverse_mask)
-                return torch.from_numpy(mask).view(1, 1, height, width).to(x.device)
+                return torch.from_numpy(mask).view(1, 1, height, width)
             else:
                 mask = channel_wise_mask(channels, self.inverse_mask)
-                return torch.from_numpy(mask).view(1, channels, 1, 1).to(x.device)
+                return torch.from_numpy(mask).view(1, channels, 1, 1)
 
         elif x.dim() == 2:
             [_, n_features] = x.shape
             if self.mask_type != "checkerboard":
                 mask = channel_wise_mask(n_features, self.inverse_mask)
-                return torch.from_numpy(mask).view(1, n_features).to(x.device)
+                return torch.from_numpy(mask).view(1, n_features)
 
         raise ValueError
 
+    def split_channels(self, x):
+        """Split inputs into the conditioning half (masked by ones) and the transformed half along channels.
+
+        Parameters
+        ----------
+        x : torch.Tensor
+
+        Returns
+        -------
+        x_cond : torch.Tensor
+        x_trans : torch.Tensor
+
+        Examples
+        --------
+        >>> scale_translate_net = lambda x: (x, x)
+        >>> f = AffineCoupling(5, scale_translate_net=scale_translate_net, inverse_mask=True, split=True)
+        >>> x_cond, x_trans = f.split_channels(torch.randn([1,5,3,3]))
+        >>> x_cond.shape, x_trans.shape
+        (torch.Size([1, 3, 3, 3]), torch.Size([1, 2, 3, 3]))
+
+        """
+        x_1, x_2 = torch.split(x, [x.shape[1] // 2, x.shape[1] - x.shape[1] // 2], dim=1)
+        if self.inverse_mask:
+            return x_2, x_1
+        return x_1, x_2
+
+    def concat_channels(self, x_cond, x_trans):
+        """Concatenate the halves split by :meth:`split_channels` in the original order of channels."""
+        if self.inverse_mask:
+            return torch.cat([x_trans, x_cond], dim=1)
+        return torch.cat([x_cond, x_trans], dim=1)
+
     def get_parameters(self, x, y=None):
         r"""
         Parameters
@@ -140,6 +204,16 @@ class AffineCoupling(Flow):
         return log_s, t
 
     def forward(self, x, y=None, compute_jacobian=True):
+        if self.split:
+            x_cond, x_trans = self.split_channels(x)
+            log_s, t = self.get_parameters(x_cond, y)
+            x = self.concat_channels(x_cond, x_trans * torch.exp(log_s) + t)
+
+            if compute_jacobian:
+                self._logdet_jacobian = log_s.reshape(log_s.size(0), -1).sum(-1)
+
+            return x
+
         mask = self.build_mask(x)
         x_masked = mask * x
         x_inv_masked = (1 - mask) * x
@@ -152,11 +226,16 @@ class AffineCoupling(Flow):
         x = x_masked + x_inv_masked * torch.exp(log_s) + t
 
         if compute_jacobian:
-            self._logdet_jacobian = log_s.view(log_s.size(0), -1).sum(-1)
+            self._logdet_jacobian = log_s.reshape(log_s.size(0), -1).sum(-1)
 
         return x
 
     def inverse(self, z, y=None):
+        if self.split:
+            z_cond, z_trans = self.split_channels(z)
+            log_s, t = self.get_parameters(z_cond, y)
+            return self.concat_channels(z_cond, (z_trans - t) * torch.exp(-log_s))
+
         mask = self.build_mask(z)
         z_masked = mask * z
         z_inv_masked = (1 - mask) * z
@@ -171,8 +250,8 @@ class AffineCoupling(Flow):
         return z
 
     def extra_repr(self):
-        return 'in_features={}, mask_type={}, inverse_mask={}'.format(
-            self.in_features, self.mask_type, self.inverse_mask
+        return 'in_features={}, mask_type={}, inverse_mask={}, split={}'.format(
+            self.in_features, self.mask_type, self.inverse_mask, self.split
         )
 
 
@@ -1,4 +1,5 @@
 import math
+import warnings
 import torch
 from torch import nn
 from torch.nn import functional as F
@@ -7,6 +8,97 @@ from ..utils import epsilon
 from .flows import Flow
 
 
+def _check_planar_invertible(wu):
+    r"""Check :math:`\mathbf{w}^T \mathbf{u} > -1` of planar flows.
+
+    At :math:`\mathbf{w}^T \mathbf{u} = -1`, the Jacobian is singular where :math:`\mathbf{w}^T \mathbf{x} + b = 0`,
+    so the flow is not invertible.
+
+    The check is asynchronous on devices other than CPU, so that it does not synchronize the host with the device.
+
+    Parameters
+    ----------
+    wu : torch.Tensor
+        :math:`\mathbf{w}^T \mathbf{u}` of any shape.
+
+    """
+    if wu.device.type == "cpu":
+        if bool(torch.any(wu <= -1)):
+            raise ValueError("The planar flow is not invertible because w^T u <= -1. Set constraint_u to True.")
+    else:
+        torch._assert_async(torch.all(wu > -1))
+
+
+def _planar_inverse(z, w, b, u_hat, max_iter=100, tol=1e-6, check_every=10, check_invertible=True):
+    r"""Invert a planar flow for a batch by a safeguarded Newton method.
+
+    Since :math:`\mathbf{z} = \mathbf{x} + \mathbf{u} \tanh(\mathbf{w}^T \mathbf{x} + b)`,
+    :math:`a = \mathbf{w}^T \mathbf{x}` is the root of the monotone function
+    :math:`g(a) = a + \mathbf{w}^T \mathbf{u} \tanh(a + b) - \mathbf{w}^T \mathbf{z}` if
+    :math:`\mathbf{w}^T \mathbf{u} > -1`, which lies in
+    :math:`[\mathbf{w}^T \mathbf{z} - |\mathbf{w}^T \mathbf{u}|, \mathbf{w}^T \mathbf{z} + |\mathbf{w}^T \mathbf{u}|]`.
+    The roots of all examples are found at once, where a Newton step is replaced with bisection if it leaves
+    the bracket. Iterations are run without gradients on the device, and the convergence is checked on the host
+    only every `check_every` iterations. If they have not converged in `max_iter` iterations, a warning is issued.
+    The gradients of the root are given by a final Newton step (the implicit function theorem).
+
+    Parameters
+    ----------
+    z : torch.Tensor
+        (n_batch, in_features)
+    w : torch.Tensor
+        (in_features)
+    b : torch.Tensor
+        Scalar.
+    u_hat : torch.Tensor
+        (in_features)
+    max_iter : int, defaults to 100
+        Maximum number of iterations.
+    tol : float, defaults to 1e-6
+        Iterations are stopped if :math:`|g(a)| \leq` tol for all examples.
+    check_every : int, defaults to 10
+        Interval of iterations to check the convergence.
+    check_invertible : bool, defaults to True
+        Whether to check :math:`\mathbf{w}^T \mathbf{u} > -1`.
+
+    Returns
+    -------
+    x : torch.Tensor
+        (n_batch, in_features)
+
+    """
+    wu = torch.dot(w, u_hat)
+    if check_invertible:
+        _check_planar_invertible(wu)
+    if z.numel() == 0:
+        return z
+
+    wz = torch.mv(z, w)  # (n_batch)
+    with torch.no_grad():
+        lower, upper = wz - wu.abs(), wz + wu.abs()
+        a = wz - wu * torch.tanh(wz + b)
+        for i in range(max_iter):
+            t = torch.tanh(a + b)
+            g = a + wu * t - wz
+            if (i + 1) % check_every == 0 and bool(torch.all(g.abs() <= tol)):
+                break
+
+            lower = torch.where(g < 0, a, lower)
+            upper = torch.where(g > 0, a, upper)
+            a_newton = a - g / (1 + wu * (1 - t ** 2))
+            a = torch.where((a_newton >= lower) & (a_newton <= upper), a_newton, (lower + upper) / 2)
+        else:
+            g = a + wu * torch.tanh(a + b) - wz
+            if not bool(torch.all(g.abs() <= tol)):
+                warnings.warn("The inverse of the planar flow has not converged in {} iterations "
+                              "(max |g(a)| = {:.3g}).".format(max_iter, g.abs().max().item()), RuntimeWarning)
+
+    # a differentiable Newton step at the root.
+    t = torch.tanh(a + b)
+    a = a - (a + wu * t - wz) / (1 + wu * (1 - t ** 2))
+    return z - torch.tanh(a + b).unsqueeze(-1) * u_hat
+
+
 class PlanarFlow(Flow):
     r"""
     Planar flow.
@@ -14,9 +106,32 @@ class PlanarFlow(Flow):
     .. math::
         f(\mathbf{x}) = \mathbf{x} + \mathbf{u} h( \mathbf{w}^T \mathbf{x} + \mathbf{b})
 
+    The inverse is computed numerically by a batched Newton method with bisection, which requires
+    :math:`\mathbf{w}^T \mathbf{u} > -1` (guaranteed if `constraint_u` is True).
+
+    Examples
+    --------
+    >>> f = PlanarFlow(2, constraint_u=True)
+    >>> x = torch.randn(3, 2)
+    >>> torch.allclose(f.inverse(f(x)), x, atol=1e-5)
+    True
+
     """
 
-    def __init__(self, in_features, constraint_u=False):
+    def __init__(self, in_features, constraint_u=False, max_iter=100, tol=1e-6):
+        """
+        Parameters
+        ----------
+        in_features : int
+            Size of input data.
+        constraint_u : bool, defaults to False
+            Whether to modify :attr:`u` so that this flow can be invertible.
+        max_iter : int, defaults to 100
+            Maximum number of iterations of the numerical inverse.
+        tol : float, defaults to 1e-6
+            Tolerance of the numerical inverse.
+
+        """
         super().__init__(in_features)
 
         self.w = nn.Parameter(torch.Tensor(1, in_features))
@@ -25,6 +140,8 @@ class PlanarFlow(Flow):
 
         self.reset_parameters()
         self.constraint_u = constraint_u
+        self.max_iter = max_iter
+        self.tol = tol
 
     def deriv_tanh(self, x):
         return 1 - torch.tanh(x) ** 2
@@ -36,15 +153,26 @@ class PlanarFlow(Flow):
         self.b.data.uniform_(-std, std)
         self.u.data.uniform_(-std, std)
 
+    def get_u_hat(self):
+        """Return :attr:`u`, which is modified if :attr:`constraint_u` is True.
+
+        Returns
+        -------
+        u_hat : torch.Tensor
+            (1, in_features)
+
+        """
+        if not self.constraint_u:
+            return self.u
+
+        # modify :attr:`u` so that this flow can be invertible.
+        wu = torch.mm(self.w, self.u.t())  # (1, 1)
+        m_wu = -1. + F.softplus(wu)
+        w_normalized = self.w / torch.norm(self.w, keepdim=True)
+        return self.u + ((m_wu - wu) * w_normalized)  # (1, in_features)
+
     def forward(self, x, y=None, compute_jacobian=True):
-        if self.constraint_u:
-            # modify :attr:`u` so that this flow can be invertible.
-            wu = torch.mm(self.w, self.u.t())  # (1, 1)
-            m_wu = -1. + F.softplus(wu)
-            w_normalized = self.w / torch.norm(self.w, keepdim=True)
-            u_hat = self.u + ((m_wu - wu) * w_normalized)  # (1, in_features)
-        else:
-            u_hat = self.u
+        u_hat = self.get_u_hat()
 
         # compute the flow transformation
         linear_output = F.linear(x, self.w, self.b)  # (n_batch, 1)
@@ -60,9 +188,156 @@ class PlanarFlow(Flow):
         return z
 
     def inverse(self, z, y=None):
-        raise NotImplementedError()
+        return _planar_inverse(z, self.w[0], self.b[0], self.get_u_hat()[0], max_iter=self.max_iter, tol=self.tol)
 
     def extra_repr(self):
         return 'in_features={}, constraint_u={}'.format(
             self.in_features, self.constraint_u
         )
+
+
+def _planar_recurrence(x, w, b, u_hat):
+    """Apply planar flows in order and return the outputs and the activations of all layers.
+
+    Parameters
+    ----------
+    x : torch.Tensor
+        (n_batch, in_features)
+    w : torch.Tensor
+        (n_layers, in_features)
+    b : torch.Tensor
+        (n_layers)
+    u_hat : torch.Tensor
+        (n_layers, in_features)
+
+    Returns
+    -------
+    z : torch.Tensor
+        (n_batch, in_features)
+    h : torch.Tensor
+        (n_layers, n_batch)
+
+    """
+    h = []
+    for k in range(w.size(0)):
+        h_k = torch.tanh(torch.addmv(b[k], x, w[k]))  # (n_batch)
+        x = torch.addr(x, h_k, u_hat[k])  # x + h_k u_hat_k^T
+        h.append(h_k)
+    return x, torch.stack(h)
+
+
+class PlanarFlowStack(Flow):
+    r"""
+    Stack of planar flows with batched parameters.
+
+    .. math::
+        f(\mathbf{x}) = f_K \circ \cdots \circ f_1(\mathbf{x}), \quad
+        f_k(\mathbf{x}) = \mathbf{x} + \mathbf{u}_k h( \mathbf{w}_k^T \mathbf{x} + b_k)
+
+    This is equivalent to :class:`FlowList` of `n_layers` :class:`PlanarFlow`, but the parameters of all layers are
+    held as (n_layers, in_features) tensors. The constrained :math:`\mathbf{u}_k` of all layers are computed at once,
+    and each layer is run by a matrix-vector product, tanh and a rank-one update. Since
+    :math:`\psi_k^T \mathbf{u}_k = h'(\cdot) \mathbf{w}_k^T \mathbf{u}_k`, the log-det Jacobians of all layers are
+    computed at once after the loop, and their sum is stored in :attr:`logdet_jacobian`.
+    The inverse is computed numerically for each layer in the reverse order, as in :class:`PlanarFlow`.
+
+    Examples
+    --------
+    >>> f = PlanarFlowStack(2, n_layers=8, constraint_u=True)
+    >>> x = torch.randn(3, 2)
+    >>> f(x).shape, f.logdet_jacobian.shape
+    (torch.Size([3, 2]), torch.Size([3]))
+    >>> torch.allclose(f.inverse(f(x)), x, atol=1e-5)
+    True
+
+    """
+
+    def __init__(self, in_features, n_layers, constraint_u=False, script=False, max_iter=100, tol=1e-6):
+        """
+        Parameters
+        ----------
+        in_features : int
+            Size of input data.
+        n_layers : int
+            Number of planar flows.
+        constraint_u : bool, defaults to False
+            Whether to modify :attr:`u` so that each flow can be invertible.
+        script : bool, defaults to False
+            Whether to run the loop over layers by TorchScript.
+        max_iter : int, defaults to 100
+            Maximum number of iterations of the numerical inverse of each layer.
+        tol : float, defaults to 1e-6
+            Tolerance of the numerical inverse of each layer.
+
+        """
+        super().__init__(in_features)
+
+        self.w = nn.Parameter(torch.Tensor(n_layers, in_features))
+        self.b = nn.Parameter(torch.Tensor(n_layers))
+        self.u = nn.Parameter(torch.Tensor(n_layers, in_features))
+
+        self.reset_parameters()
+        self.n_layers = n_layers
+        self.constraint_u = constraint_u
+        self.script = script
+        self.max_iter = max_iter
+        self.tol = tol
+        self._recurrence = None
+
+    def reset_parameters(self):
+        std = 1. / math.sqrt(self.w.size(1))
+
+        self.w.data.uniform_(-std, std)
+        self.b.data.uniform_(-std, std)
+        self.u.data.uniform_(-std, std)
+
+    def get_u_hat(self):
+        r"""Return :math:`\mathbf{u}` of all layers, which are modified if :attr:`constraint_u` is True.
+
+        Returns
+        -------
+        u_hat : torch.Tensor
+            (n_layers, in_features)
+
+        """
+        if not self.constraint_u:
+            return self.u
+
+        wu = torch.sum(self.w * self.u, dim=-1, keepdim=True)  # (n_layers, 1)
+        m_wu = -1. + F.softplus(wu)
+        w_normalized = self.w / torch.norm(self.w, dim=-1, keepdim=True)
+        return self.u + ((m_wu - wu) * w_normalized)  # (n_layers, in_features)
+
+    def _get_recurrence(self):
+        if not self.script:
+            return _planar_recurrence
+        if self._recurrence is None:
+            self._recurrence = torch.jit.script(_planar_recurrence)
+        return self._recurrence
+
+    def forward(self, x, y=None, compute_jacobian=True):
+        u_hat = self.get_u_hat()
+        z, h = self._get_recurrence()(x, self.w, self.b, u_hat)  # h: (n_layers, n_batch)
+
+        if compute_jacobian:
+            # compute the log-det Jacobians of all layers, 1 + h'(w^T x + b) w^T u_hat.
+            wu_hat = torch.sum(self.w * u_hat, dim=-1, keepdim=True)  # (n_layers, 1)
+            det_jacobian = 1. + (1 - h ** 2) * wu_hat  # (n_layers, n_batch)
+            logdet_jacobian = torch.log(torch.abs(det_jacobian) + epsilon())
+            self._logdet_jacobian = logdet_jacobian.sum(0)
+
+        return z
+
+    def inverse(self, z, y=None):
+        u_hat = self.get_u_hat()
+        # the invertibility of all layers is checked at once.
+        _check_planar_invertible(torch.sum(self.w * u_hat, dim=-1))
+        for k in reversed(range(self.n_layers)):
+            z = _planar_inverse(z, self.w[k], self.b[k], u_hat[k], max_iter=self.max_iter, tol=self.tol,
+                                check_invertible=False)
+        return z
+
+    def extra_repr(self):
+        return 'in_features={}, n_layers={}, constraint_u={}'.format(
+            self.in_features, self.n_layers, self.constraint_u
+        )
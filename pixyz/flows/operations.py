@@ -53,15 +53,8 @@ class Squeeze(Flow):
         if height % 2 != 0 or width % 2 != 0:
             raise ValueError
 
-        x = x.permute(0, 2, 3, 1)
-
-        x = x.view(-1, height // 2, 2, width // 2, 2, channels)
-        x = x.permute(0, 1, 3, 5, 2, 4)
-        x = x.contiguous().view(-1, height // 2, width // 2, channels * 4)
-
-        z = x.permute(0, 3, 1, 2)
-
-        return z
+        # the output channel c * 4 + 2 * i + j takes the pixel (i, j) of each 2 x 2 block of the channel c.
+        return F.pixel_unshuffle(x, 2)
 
     def inverse(self, z, y=None):
         [_, channels, height, width] = z.shape
@@ -69,15 +62,7 @@ class Squeeze(Flow):
         if channels % 4 != 0:
             raise ValueError
 
-        z = z.permute(0, 2, 3, 1)
-
-        z = z.view(-1, height, width, channels // 4, 2, 2)
-        z = z.permute(0, 1, 4, 2, 5, 3)
-        z = z.contiguous().view(-1, 2 * height, 2 * width, channels // 4)
-
-        x = z.permute(0, 3, 1, 2)
-
-        return x
+        return F.pixel_shuffle(z, 2)
 
 
 class Unsqueeze(Squeeze):
@@ -179,23 +164,21 @@ class Permutation(Flow):
 
     def __init__(self, permute_indices):
         super().__init__(len(permute_indices))
-        self.permute_indices = permute_indices
-        self.inv_permute_indices = np.argsort(self.permute_indices)
+        permute_indices = torch.as_tensor(np.asarray(permute_indices), dtype=torch.long)
+        # indices are moved with the module, so that they are not uploaded on every call.
+        self.register_buffer('permute_indices', permute_indices, persistent=False)
+        self.register_buffer('inv_permute_indices', torch.argsort(permute_indices), persistent=False)
         self._logdet_jacobian = 0
 
     def forward(self, x, y=None, compute_jacobian=True):
-        if x.dim() == 2:
-            return x[:, self.permute_indices]
-        elif x.dim() == 4:
-            return x[:, self.permute_indices, :, :]
-        raise ValueError
+        if x.dim() not in [2, 4]:
+            raise ValueError
+        return x.index_select(1, self.permute_indices)
 
     def inverse(self, z, y=None):
-        if z.dim() == 2:
-            return z[:, self.inv_permute_indices]
-        elif z.dim() == 4:
-            return z[:, self.inv_permute_indices, :, :]
-        raise ValueError
+        if z.dim() not in [2, 4]:
+            raise ValueError
+        return z.index_select(1, self.inv_permute_indices)
 
 
 class Shuffle(Permutation):
@@ -211,19 +194,49 @@ class Reverse(Permutation):
 
 
 class Flatten(Flow):
+    """
+    Flatten operation.
+
+    (c, h, w) -> c * h * w
+
+    :meth:`forward` accepts inputs of any shape and does not record it. :meth:`inverse` restores the shape
+    given by its argument `in_size`, or by `in_size` of the constructor if it is omitted,
+    so that it does not depend on previous inputs.
+
+    Examples
+    --------
+    >>> import torch
+    >>> f = Flatten(in_size=[2, 3, 3])
+    >>> x = torch.randn(4, 2, 3, 3)
+    >>> f(x).shape
+    torch.Size([4, 18])
+    >>> torch.equal(f.inverse(f(x)), x)
+    True
+    >>> f = Flatten()
+    >>> x = torch.randn(4, 3, 2, 2)
+    >>> torch.equal(f.inverse(f(x), in_size=[3, 2, 2]), x)
+    True
+    >>> f.inverse(f(x))
+    Traceback (most recent call last):
+     ...
+    ValueError: The shape of outputs is unknown. Set `in_size` of Flatten or its inverse.
+
+    """
+
     def __init__(self, in_size=None):
         super().__init__(None)
-        self.in_size = in_size
+        self.in_size = None if in_size is None else torch.Size(in_size)
         self._logdet_jacobian = 0
 
     def forward(self, x, y=None, compute_jacobian=True):
-        self.in_size = x.shape[1:]
-        return x.view(x.size(0), -1)
-
-    def inverse(self, z, y=None):
-        if self.in_size is None:
-            raise ValueError
-        return z.view(z.size(0), self.in_size[0], self.in_size[1], self.in_size[2])
+        return x.flatten(1)
+
+    def inverse(self, z, y=None, in_size=None):
+        if in_size is None:
+            in_size = self.in_size
+        if in_size is None:
+            raise ValueError("The shape of outputs is unknown. Set `in_size` of Flatten or its inverse.")
+        return z.unflatten(1, in_size)
 
 
 class Preprocess(Flow):
@@ -1,4 +1,3 @@
-import sympy
 from torch import optim, nn
 import torch
 from .losses import Loss
@@ -223,6 +222,7 @@ class AdversarialJensenShannon(AdversarialLoss):
 
     @property
     def _symbol(self):
+        import sympy
         return sympy.Symbol("mean(D_{{JS}}^{{Adv}} \\left[{}||{} \\right])".format(self.p.prob_text,
                                                                                    self.q.prob_text))
 
@@ -384,6 +384,7 @@ class AdversarialKullbackLeibler(AdversarialLoss):
 
     @property
     def _symbol(self):
+        import sympy
         return sympy.Symbol("mean(D_{{KL}}^{{Adv}} \\left[{}||{} \\right])".format(self.p.prob_text,
                                                                                    self.q.prob_text))
 
@@ -540,6 +541,7 @@ class AdversarialWassersteinDistance(AdversarialJensenShannon):
 
     @property
     def _symbol(self):
+        import sympy
         return sympy.Symbol("mean(W^{{Adv}} \\left({}, {} \\right))".format(self.p.prob_text, self.q.prob_text))
 
     def d_loss(self, y_p, y_q, *args, **kwargs):
@@ -0,0 +1,368 @@
+from torch.distributions import kl_divergence
+
+from ..utils import sum_samples
+from ..distributions.distributions import DistributionBase, MultiplyDistribution, ReplaceVarDistribution,\
+    MarginalizeVarDistribution
+from .losses import Loss
+
+
+class LossCompiler(object):
+    """Build a flat execution plan of a loss class.
+
+    The loss tree is traversed once, and distribution calls (setting parameters, sampling, and evaluating
+    log-likelihoods) are registered as nodes of a directed acyclic graph.
+    Identical nodes, i.e., the same operation on the same distribution with the same inputs, are registered
+    only once, so that the shared distributions are not run again.
+
+    Each node is a pair of a function and the indices of its input nodes, and nodes are stored in a topologically
+    sorted list. The function is called as `function(context, *input_values)`.
+
+    """
+
+    def __init__(self):
+        self.nodes = []
+        self._node_ids = {}
+        self._forward_nodes = set()
+        self.n_forward_requests = 0
+        self.n_forward_passes = 0
+
+    def add(self, key, function, inputs=(), forward=False):
+        """Register a node, or return the index of the identical node if it has already been registered.
+
+        Parameters
+        ----------
+        key : tuple
+            Key to identify this node.
+        function : function
+            Function called as `function(context, *input_values)`.
+        inputs : :obj:`tuple` of :obj:`int`
+            Indices of input nodes.
+        forward : bool, defaults to False
+            Whether this node runs the forward computation of a distribution.
+
+        Returns
+        -------
+        int
+            Index of the node.
+
+        """
+        if forward:
+            self.n_forward_requests += 1
+
+        if key in self._node_ids:
+            return self._node_ids[key]
+
+        if forward:
+            self.n_forward_passes += 1
+            self._forward_nodes.add(len(self.nodes))
+
+        self.nodes.append((function, tuple(inputs)))
+        self._node_ids[key] = len(self.nodes) - 1
+        return self._node_ids[key]
+
+    def prune(self, output):
+        """Remove nodes which the output node does not depend on, e.g., sampling of variables unused by the loss.
+
+        Parameters
+        ----------
+        output : int
+            Index of the output node.
+
+        Returns
+        -------
+        int
+            Index of the output node after pruning.
+
+        """
+        required = {output}
+        for index in range(output, -1, -1):
+            if index in required:
+                required.update(self.nodes[index][1])
+
+        new_ids = {}
+        nodes = []
+        for index, (function, inputs) in enumerate(self.nodes):
+            if index in required:
+                new_ids[index] = len(nodes)
+                nodes.append((function, tuple(new_ids[i] for i in inputs)))
+
+        self.n_forward_passes -= len(self._forward_nodes - required)
+        self._forward_nodes = set(new_ids[index] for index in self._forward_nodes & required)
+        self._node_ids = {key: new_ids[index] for key, index in self._node_ids.items() if index in required}
+        self.nodes = nodes
+        return new_ids[output]
+
+    def lookup(self, scope, var):
+        """Return the index of the node bound to `var` in `scope` (given inputs are bound lazily)."""
+        if var not in scope:
+            scope[var] = self.add(("input", var), lambda ctx, var=var: ctx.x_dict[var])
+        return scope[var]
+
+    def constant(self, value):
+        return self.add(("constant", id(value)), lambda ctx: value)
+
+    def env(self, scope):
+        """Return the index of the node which gathers all variables visible in `scope` into a dictionary."""
+        names = tuple(scope.keys())
+        inputs = tuple(scope[name] for name in names)
+
+        def _env(ctx, *values):
+            x_dict = dict(ctx.x_dict)
+            x_dict.update(zip(names, values))
+            return x_dict
+
+        return self.add(("env", names, inputs), _env, inputs)
+
+    def loss(self, loss, scope):
+        """Return the index of the node which evaluates `loss`."""
+        if loss is None:
+            return self.constant(0)
+        return loss._plan(self, scope)
+
+    def apply(self, function, losses, scope):
+        """Return the index of the node which applies `function` to the values of `losses`."""
+        inputs = tuple(self.loss(loss, scope) for loss in losses)
+        return self.add((function,) + inputs, lambda ctx, *values: function(*values), inputs)
+
+    def opaque(self, loss, scope):
+        """Return the index of the node which evaluates `loss` by its own :meth:`_get_eval`."""
+        env = self.env(scope)
+
+        def _eval(ctx, x_dict):
+            value, samples = loss._get_eval(x_dict, **ctx.kwargs)
+            ctx.samples.update(samples)
+            return value
+
+        return self.add(("opaque", id(loss), env), _eval, (env,))
+
+    @staticmethod
+    def _unwrap(p):
+        """Return the distribution which can be handled as nodes and the correspondence of variable names."""
+        replace_dict = {}
+        if isinstance(p, ReplaceVarDistribution):
+            replace_dict = p._replace_dict
+            p = p.p
+
+        if isinstance(p, DistributionBase) and len(p.var) == 1:
+            return p, replace_dict
+        return None, replace_dict
+
+    def dist(self, p, scope, sampling=None):
+        """Return the index of the node which sets the parameters of `p` and returns its PyTorch distribution.
+
+        Parameters
+        ----------
+        p : pixyz.distributions.DistributionBase
+        scope : dict
+        sampling : :obj:`bool` or :obj:`NoneType`, defaults to None
+            If None, the default value of :meth:`set_dist` of `p` is used.
+
+        """
+        p, replace_dict = self._unwrap(p)
+        if p is None:
+            raise ValueError("Parameters of this distribution cannot be set in an execution plan.")
+
+        names = tuple(p.cond_var)
+        inputs = tuple(self.lookup(scope, replace_dict.get(var, var)) for var in names)
+
+        if hasattr(p, "relaxed_distribution_torch_class"):
+            set_dist_kwargs = {} if sampling is None else {"sampling": sampling}
+            key_sampling = True if sampling is None else sampling
+        else:
+            # the other distributions ignore `sampling`
+            set_dist_kwargs = {}
+            key_sampling = None
+
+        def _set_dist(ctx, *values):
+            p.set_dist(dict(zip(names, values)), **set_dist_kwargs)
+            return p.dist
+
+        return self.add(("dist", id(p), key_sampling, inputs), _set_dist, inputs, forward=True)
+
+    def sample(self, p, scope, reparam=False):
+        """Return a new scope in which variables of `p` are bound to sampling nodes."""
+        scope = dict(scope)
+
+        if isinstance(p, MultiplyDistribution):
+            for factor in p.factors:
+                scope = self.sample(factor, scope, reparam=reparam)
+            return scope
+
+        if isinstance(p, MarginalizeVarDistribution):
+            # marginalized variables are bound only in the inner scope.
+            inner_scope = self.sample(p.p, scope, reparam=reparam)
+            scope.update({var: inner_scope[var] for var in p.var})
+            return scope
+
+        base_p, replace_dict = self._unwrap(p)
+        if base_p is not None and type(base_p).sample is DistributionBase.sample:
+            dist = self.dist(p, scope)
+            var = replace_dict.get(base_p.var[0], base_p.var[0])
+
+            def _sample(ctx, dist):
+                if reparam:
+                    value = dist.rsample()
+                else:
+                    value = dist.sample()
+                ctx.samples[var] = value
+                return value
+
+            scope[var] = self.add(("sample", dist, reparam), _sample, (dist,))
+            return scope
+
+        env = self.env(scope)
+
+        def _sample_all(ctx, x_dict):
+            samples = p.sample(x_dict, reparam=reparam, return_all=False)
+            ctx.samples.update(samples)
+            return samples
+
+        # outputs of deterministic distributions are shared regardless of reparam.
+        key_reparam = None if p.distribution_name == "Deterministic" else reparam
+        samples = self.add(("sample_all", id(p), env, key_reparam), _sample_all, (env,))
+        for var in p.var:
+            scope[var] = self.add(("getitem", samples, var), lambda ctx, samples, var=var: samples[var], (samples,))
+        return scope
+
+    def log_prob(self, p, scope, sum_features=True, feature_dims=None):
+        """Return the index of the node which evaluates the log-likelihood of `p`."""
+        if isinstance(p, MultiplyDistribution):
+            log_probs = tuple(self.log_prob(factor, scope, sum_features, feature_dims) for factor in p.factors)
+            return self.add((sum,) + log_probs, lambda ctx, *values: sum(values), log_probs)
+
+        if isinstance(p, MarginalizeVarDistribution):
+            # outputs of deterministic factors are bound to the same nodes as the other consumers.
+            deterministic_factors, factors = p._split_deterministic_factors()
+            for factor in deterministic_factors:
+                scope = self.sample(factor, scope)
+            log_probs = tuple(self.log_prob(factor, scope, sum_features, feature_dims) for factor in factors)
+            return self.add((sum,) + log_probs, lambda ctx, *values: sum(values), log_probs)
+
+        base_p, replace_dict = self._unwrap(p)
+        if base_p is not None and type(base_p).get_log_prob is DistributionBase.get_log_prob:
+            dist = self.dist(p, scope, sampling=False)
+            x = self.lookup(scope, replace_dict.get(base_p.var[0], base_p.var[0]))
+
+            def _log_prob(ctx, dist, x):
+                log_prob = dist.log_prob(x)
+                if sum_features:
+                    log_prob = sum_samples(log_prob, base_p._get_feature_dims(feature_dims, len(dist.event_shape)))
+                return log_prob
+
+            key = ("log_prob", dist, x, sum_features, base_p._get_feature_dims(feature_dims))
+            return self.add(key, _log_prob, (dist, x))
+
+        env = self.env(scope)
+        return self.add(("get_log_prob", id(p), env, sum_features, p._get_feature_dims(feature_dims)),
+                        lambda ctx, x_dict: p.get_log_prob(x_dict, sum_features=sum_features,
+                                                           feature_dims=feature_dims), (env,))
+
+    def entropy(self, p, scope):
+        """Return the index of the node which evaluates the analytical entropy of `p`."""
+        base_p, _ = self._unwrap(p)
+        if base_p is not None and type(base_p).get_entropy is DistributionBase.get_entropy:
+            dist = self.dist(p, scope, sampling=False)
+            return self.add(("entropy", dist), lambda ctx, dist: sum_samples(
+                dist.entropy(), base_p._get_feature_dims(event_dim=len(dist.event_shape))), (dist,))
+
+        env = self.env(scope)
+        return self.add(("get_entropy", id(p), env), lambda ctx, x_dict: p.get_entropy(x_dict), (env,))
+
+    def kl_divergence(self, p, q, scope, dim=None):
+        """Return the index of the node which evaluates the analytical KL divergence between `p` and `q`."""
+        p_dist = self.dist(p, scope)
+        q_dist = self.dist(q, scope)
+        base_p, _ = self._unwrap(p)
+
+        def _kl_divergence(ctx, p_dist, q_dist):
+            divergence = kl_divergence(p_dist, q_dist)
+            return sum_samples(divergence, base_p._get_feature_dims(dim or None, len(p_dist.event_shape)))
+
+        return self.add(("kl", p_dist, q_dist, base_p._get_feature_dims(dim or None)), _kl_divergence,
+                        (p_dist, q_dist))
+
+    def can_set_dist(self, p):
+        return self._unwrap(p)[0] is not None
+
+
+class _Context(object):
+    def __init__(self, x_dict, kwargs):
+        self.x_dict = x_dict
+        self.kwargs = kwargs
+        self.samples = {}
+
+
+class CompiledLoss(Loss):
+    r"""
+    Loss class evaluated by a flat execution plan.
+
+    The given loss class is traversed once by :class:`LossCompiler`, and the distribution calls shared among
+    terms are deduplicated. For example, in a VAE loss, the encoder :math:`q(z|x)` is run once for
+    both the expectation (sampling) and the KL divergence.
+    Note that terms taking expectations over the same distribution with the same inputs share one
+    Monte Carlo sample.
+    Factors of products of distributions which are not required by the loss (e.g., an auxiliary variable
+    which is sampled but not used) are not run, so that their samples are not contained in the returned samples.
+
+    Examples
+    --------
+    >>> import torch
+    >>> from pixyz.distributions import Normal
+    >>> from pixyz.losses import KullbackLeibler
+    >>> q = Normal(loc="x", scale=torch.tensor(1.), var=["z"], cond_var=["x"], features_shape=[10], name="q")
+    >>> p = Normal(loc="z", scale=torch.tensor(1.), var=["x"], cond_var=["z"], features_shape=[10])
+    >>> prior = Normal(loc=torch.tensor(0.), scale=torch.tensor(1.), var=["z"], features_shape=[10],
+    ...                name="p_{prior}")
+    >>> loss_cls = (-p.log_prob().expectation(q) + KullbackLeibler(q, prior)).mean()
+    >>> compiled_loss_cls = loss_cls.compile()
+    >>> print(compiled_loss_cls)
+    mean \left(D_{KL} \left[q(z|x)||p_{prior}(z) \right] - \mathbb{E}_{q(z|x)} \left[\log p(x|z) \right] \right)
+    >>> compiled_loss_cls.n_forward_passes, compiled_loss_cls.n_removed_forward_passes
+    (3, 1)
+    >>> loss = compiled_loss_cls.eval({"x": torch.randn(2, 10)})
+
+    """
+
+    def __init__(self, loss):
+        """
+        Parameters
+        ----------
+        loss : pixyz.losses.losses.Loss
+            Loss class to compile.
+
+        """
+        self.loss = loss
+        self._input_var = loss.input_var
+
+        compiler = LossCompiler()
+        self._output = compiler.prune(compiler.loss(loss, {}))
+        self._nodes = compiler.nodes
+
+        self.n_forward_passes = compiler.n_forward_passes
+        self.n_removed_forward_passes = compiler.n_forward_requests - compiler.n_forward_passes
+
+    @property
+    def n_nodes(self):
+        """int: The number of nodes in the execution plan."""
+        return len(self._nodes)
+
+    @property
+    def _symbol(self):
+        return self.loss._symbol
+
+    def _plan(self, compiler, scope):
+        return self.loss._plan(compiler, scope)
+
+    def compile(self):
+        return self
+
+    def _get_eval(self, x_dict={}, **kwargs):
+        ctx = _Context(x_dict, kwargs)
+
+        values = []
+        for function, inputs in self._nodes:
+            values.append(function(ctx, *[values[i] for i in inputs]))
+
+        samples = dict(x_dict)
+        samples.update(ctx.samples)
+        return values[self._output], samples
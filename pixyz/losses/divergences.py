@@ -1,8 +1,6 @@
-import sympy
-import torch
 from torch.distributions import kl_divergence
 
-from ..utils import get_dict_values
+from ..utils import get_dict_values, sum_samples
 from .losses import Loss
 
 
@@ -33,6 +31,7 @@ class KullbackLeibler(Loss):
 
     @property
     def _symbol(self):
+        import sympy
         return sympy.Symbol("D_{{KL}} \\left[{}||{} \\right]".format(self.p.prob_text, self.q.prob_text))
 
     def _get_eval(self, x_dict, **kwargs):
@@ -47,15 +46,14 @@ class KullbackLeibler(Loss):
         self.q.set_dist(input_dict)
 
         divergence = kl_divergence(self.p.dist, self.q.dist)
-
-        if self.dim:
-            divergence = torch.sum(divergence, dim=self.dim)
-            return divergence, x_dict
-
-        dim_list = list(torch.arange(divergence.dim()))
-        divergence = torch.sum(divergence, dim=dim_list[1:])
+        divergence = sum_samples(divergence, self.p._get_feature_dims(self.dim or None, len(self.p.dist.event_shape)))
         return divergence, x_dict
 
+    def _plan(self, compiler, scope):
+        if compiler.can_set_dist(self.p) and compiler.can_set_dist(self.q):
+            return compiler.kl_divergence(self.p, self.q, scope, dim=self.dim)
+        return super()._plan(compiler, scope)
+
         """
         if (self._p1.distribution_name == "vonMisesFisher" and \
             self._p2.distribution_name == "HypersphericalUniform"):
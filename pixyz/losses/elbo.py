@@ -1,4 +1,8 @@
-from .losses import SetLoss
+import torch
+from torch.distributions import kl_divergence
+
+from ..utils import tolist, get_dict_values
+from .losses import Loss, SetLoss
 
 
 class ELBO(SetLoss):
@@ -29,3 +33,166 @@ class ELBO(SetLoss):
 
         loss = (p.log_prob() - q.log_prob()).expectation(q, input_var)
         super().__init__(loss)
+
+
+class MultimodalELBO(Loss):
+    r"""
+    The sum of the evidence lower bounds over subsets of modalities for the product of experts.
+
+    .. math::
+
+        \sum_{S} \mathbb{E}_{q(z|x_S)} \left[\sum_{m \in S} \log p(x_m|z) \right] - D_{KL}[q(z|x_S)||p(z)],
+
+    where :math:`q(z|x_S) \propto p(z)\prod_{m \in S} q(z|x_m)` is the product of experts of the subset :math:`S`.
+
+    Each expert is evaluated once, and the posteriors of all subsets are computed from its outputs.
+    Then, the ELBOs of all subsets are evaluated at once, where each decoder is also evaluated once for
+    the samples of all subsets including its modality.
+    Therefore, the number of forward passes does not depend on the number of subsets.
+
+    References
+    ----------
+    [Wu+ 2018] Multimodal Generative Models for Scalable Weakly-Supervised Learning
+
+    Examples
+    --------
+    >>> import torch
+    >>> from pixyz.distributions import Normal, ProductOfNormal
+    >>> q_x = Normal(loc="x", scale=torch.tensor(1.), var=["z"], cond_var=["x"], features_shape=[4], name="q")
+    >>> q_y = Normal(loc="y", scale=torch.tensor(1.), var=["z"], cond_var=["y"], features_shape=[4], name="q")
+    >>> q = ProductOfNormal([q_x, q_y], name="q")
+    >>> p_x = Normal(loc="z", scale=torch.tensor(1.), var=["x"], cond_var=["z"], features_shape=[4])
+    >>> p_y = Normal(loc="z", scale=torch.tensor(1.), var=["y"], cond_var=["z"], features_shape=[4])
+    >>> prior = Normal(loc=torch.tensor(0.), scale=torch.tensor(1.), var=["z"], features_shape=[4],
+    ...                name="p_{prior}")
+    >>> loss_cls = MultimodalELBO([p_x, p_y], q, prior)
+    >>> loss_cls.subsets
+    [['x', 'y'], ['x'], ['y']]
+    >>> print(loss_cls)  # doctest: +NORMALIZE_WHITESPACE
+    - D_{KL} \left[q(z|x)||p_{prior}(z) \right] - D_{KL} \left[q(z|x,y)||p_{prior}(z) \right]
+    - D_{KL} \left[q(z|y)||p_{prior}(z) \right] + \mathbb{E}_{q(z|x)} \left[\log p(x|z) \right]
+    + \mathbb{E}_{q(z|x,y)} \left[\log p(x|z) + \log p(y|z) \right] + \mathbb{E}_{q(z|y)} \left[\log p(y|z) \right]
+    >>> loss = loss_cls.eval({"x": torch.randn(2, 4), "y": torch.randn(2, 4)})
+    >>> loss.shape
+    torch.Size([2])
+
+    """
+
+    def __init__(self, p, q, prior, subsets=None, input_var=None):
+        """
+        Parameters
+        ----------
+        p : :obj:`list` of :class:`pixyz.distributions.Distribution`
+            Decoders of modalities, e.g., :math:`[p(x|z), p(y|z)]`.
+        q : pixyz.distributions.ProductOfNormal
+            Product of experts, e.g., :math:`q(z|x,y)`.
+        prior : pixyz.distributions.Distribution
+            Prior distribution, e.g., :math:`p(z)`.
+        subsets : :obj:`list` of :obj:`list` of :obj:`str`, defaults to None
+            Subsets of modalities (input variables of experts).
+            An expert is included in a subset if all its input variables are in the subset, and
+            a decoder is included if all its variables are in the subset.
+            If None, the full set and the inputs of each expert are used, as in [Wu+ 2018].
+        input_var : :obj:`list` of :obj:`str`, defaults to None
+            Input variables of this loss function.
+
+        """
+        from ..distributions.poe import ProductOfNormal, ElementWiseProductOfNormal
+        if not isinstance(q, ProductOfNormal) or isinstance(q, ElementWiseProductOfNormal):
+            raise ValueError("q must be an instance of ProductOfNormal, got %s." % type(q).__name__)
+
+        self.p_list = tolist(p)
+        self.prior = prior
+        self._z_var = q.var[0]
+        self._experts = list(q.p) if isinstance(q.p, torch.nn.ModuleList) else [q.p]
+
+        if subsets is None:
+            subsets = [q.cond_var]
+            if len(self._experts) > 1:
+                subsets = subsets + [_p.cond_var for _p in self._experts]
+        self.subsets = [list(subset) for subset in subsets]
+
+        # membership of experts (n_subset, n_expert)
+        self._expert_masks = torch.tensor([[set(_p.cond_var) <= set(subset) for _p in self._experts]
+                                           for subset in self.subsets], dtype=torch.bool)
+        # indices of subsets including each decoder
+        self._decoder_subsets = [torch.tensor([i for i, subset in enumerate(self.subsets)
+                                               if set(_p.var) <= set(subset)], dtype=torch.long)
+                                 for _p in self.p_list]
+
+        if input_var is None:
+            input_var = list(q.input_var)
+            for _p in self.p_list + [prior]:
+                input_var += [var for var in _p.input_var + _p.var if var != self._z_var]
+            input_var = sorted(set(input_var), key=input_var.index)
+
+        super().__init__(q, prior, input_var=input_var)
+
+    @property
+    def _symbol(self):
+        import sympy
+        symbol = 0
+        for subset in self.subsets:
+            q_text = "{}({}|{})".format(self.p.name, self._z_var, ",".join(subset))
+            log_probs = ["\\log {}".format(_p.prob_text) for _p in self.p_list if set(_p.var) <= set(subset)]
+            if len(log_probs) > 0:
+                symbol += sympy.Symbol("\\mathbb{{E}}_{{{}}} \\left[{} \\right]".format(q_text, " + ".join(log_probs)))
+            symbol -= sympy.Symbol("D_{{KL}} \\left[{}||{} \\right]".format(q_text, self.prior.prob_text))
+        return symbol
+
+    def _get_subset_params(self, x_dict, **kwargs):
+        """Get the parameters of the product of experts for all subsets, evaluating each expert once.
+
+        Returns
+        -------
+        loc : torch.Tensor
+            (n_subset, n_batch, output_dim)
+        scale : torch.Tensor
+            (n_subset, n_batch, output_dim)
+
+        """
+        loc, scale = self.p._get_expert_params(x_dict, **kwargs)  # (n_expert, n_batch, output_dim)
+
+        # exclude experts of each subset by setting zero to their scales.
+        expert_masks = self._expert_masks.t().to(loc.device)
+        expert_masks = expert_masks.reshape(expert_masks.shape + (1,) * (loc.dim() - 1))
+        loc = loc.unsqueeze(1).expand((-1, expert_masks.shape[1]) + loc.shape[1:])
+        scale = torch.where(expert_masks, scale.unsqueeze(1), scale.new_zeros(()))
+
+        return self.p._compute_expert_params(loc, scale)  # (n_subset, n_batch, output_dim)
+
+    def _get_eval(self, x_dict, **kwargs):
+        loc, scale = self._get_subset_params(x_dict, **kwargs)
+        n_subset, n_batch = loc.shape[:2]
+
+        q_dist = self.p._create_dist(self.p.distribution_torch_class, loc=loc, scale=scale)
+        z = q_dist.rsample()  # (n_subset, n_batch, output_dim)
+
+        self.prior.set_dist(get_dict_values(x_dict, self.prior.input_var, True))
+        divergence = kl_divergence(q_dist, self.prior.dist)
+        elbo = -divergence.reshape(n_subset, n_batch, -1).sum(-1)
+
+        masks = kwargs.get("masks", None) or {}
+        for _p, subset_index in zip(self.p_list, self._decoder_subsets):
+            if len(subset_index) == 0:
+                continue
+            subset_index = subset_index.to(z.device)
+            n_repeat = len(subset_index)
+
+            # fold the subsets into the batch so that the decoder is run once.
+            inputs = {}
+            for var in _p.var + _p.input_var:
+                if var == self._z_var:
+                    inputs[var] = z[subset_index].reshape((-1,) + z.shape[2:])
+                else:
+                    value = x_dict[var]
+                    inputs[var] = value.unsqueeze(0).expand((n_repeat,) + value.shape).reshape(
+                        (-1,) + value.shape[1:])
+
+            log_prob = _p.get_log_prob(inputs).reshape(n_repeat, n_batch)
+            for var in _p.var:
+                if var in masks:
+                    log_prob = log_prob * masks[var].to(log_prob.dtype)
+            elbo = elbo.index_add(0, subset_index, log_prob)
+
+        return elbo.sum(0), x_dict
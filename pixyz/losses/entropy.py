@@ -1,4 +1,3 @@
-import sympy
 
 from .losses import Loss, SetLoss
 
@@ -56,6 +55,7 @@ class AnalyticalEntropy(Loss):
 
     @property
     def _symbol(self):
+        import sympy
         p_text = "{" + self.p.prob_text + "}"
         return sympy.Symbol("- \\mathbb{{E}}_{} \\left[{} \\right]".format(p_text, self.p.log_prob().loss_text))
 
@@ -68,6 +68,11 @@ class AnalyticalEntropy(Loss):
 
         return entropy, x_dict
 
+    def _plan(self, compiler, scope):
+        if not hasattr(self.p, 'distribution_torch_class'):
+            return super()._plan(compiler, scope)
+        return compiler.entropy(self.p, scope)
+
 
 class CrossEntropy(SetLoss):
     r"""
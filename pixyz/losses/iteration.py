@@ -1,5 +1,4 @@
 from copy import deepcopy
-import sympy
 
 from .losses import Loss
 from ..utils import get_dict_values
@@ -81,7 +80,6 @@ class IterativeLoss(Loss):
         self.max_iter = max_iter
         self.update_value = update_value
         self.timestep_var = timestep_var
-        self.timpstep_symbol = sympy.Symbol(self.timestep_var[0])
 
         if (series_var is None) and (max_iter is None):
             raise ValueError()
@@ -103,8 +101,14 @@ class IterativeLoss(Loss):
 
         self.series_var = series_var
 
+    @property
+    def timpstep_symbol(self):
+        import sympy
+        return sympy.Symbol(self.timestep_var[0])
+
     @property
     def _symbol(self):
+        import sympy
         # TODO: naive implementation
         dummy_loss = sympy.Symbol("dummy_loss")
         if self.max_iter:
@@ -1,8 +1,8 @@
 import abc
-import sympy
 import torch
 
 import numbers
+import operator
 from copy import deepcopy
 
 from ..utils import tolist
@@ -91,6 +91,7 @@ class Loss(object, metaclass=abc.ABCMeta):
 
     @property
     def loss_text(self):
+        import sympy
         return sympy.latex(self._symbol)
 
     def __str__(self):
@@ -159,7 +160,7 @@ class Loss(object, metaclass=abc.ABCMeta):
         """
         return BatchSum(self)
 
-    def expectation(self, p, input_var=None, sample_shape=torch.Size()):
+    def expectation(self, p, input_var=None, sample_shape=torch.Size(), vectorized=False, target_var=None):
         """Return an instance of :class:`pixyz.losses.Expectation`.
 
         Parameters
@@ -173,13 +174,35 @@ class Loss(object, metaclass=abc.ABCMeta):
         sample_shape : :obj:`list` or :obj:`NoneType`, defaults to torch.Size()
             Shape of generating samples.
 
+        vectorized : :obj:`bool`, defaults to False
+            Whether to draw all samples at once and evaluate this loss on them in a single batch.
+
+        target_var : :obj:`list` of :obj:`str`, defaults to None
+            Variables of `p` to sample. See :class:`pixyz.losses.Expectation`.
+
         Returns
         -------
         pixyz.losses.Expectation
             An instance of :class:`pixyz.losses.Expectation`
 
         """
-        return Expectation(p, self, input_var=input_var, sample_shape=sample_shape)
+        return Expectation(p, self, input_var=input_var, sample_shape=sample_shape, vectorized=vectorized,
+                           target_var=target_var)
+
+    def compile(self):
+        """Return an instance of :class:`pixyz.losses.compiler.CompiledLoss`.
+
+        The loss tree is converted to a flat execution plan, in which distribution calls shared among terms
+        (e.g., the encoder in both the reconstruction term and the KL term) are run only once.
+
+        Returns
+        -------
+        pixyz.losses.compiler.CompiledLoss
+            An instance of :class:`pixyz.losses.compiler.CompiledLoss`
+
+        """
+        from .compiler import CompiledLoss
+        return CompiledLoss(self)
 
     def eval(self, x_dict={}, return_dict=False, **kwargs):
         """Evaluate the value of the loss function given inputs (:attr:`x_dict`).
@@ -216,6 +239,24 @@ class Loss(object, metaclass=abc.ABCMeta):
     def _get_eval(self, x_dict, **kwargs):
         raise NotImplementedError()
 
+    def _plan(self, compiler, scope):
+        """Register this loss to an execution plan, and return the index of the node which evaluates it.
+
+        By default, this loss is evaluated by :meth:`_get_eval` as a single node.
+
+        Parameters
+        ----------
+        compiler : pixyz.losses.compiler.LossCompiler
+        scope : dict
+            Correspondence between variables and nodes.
+
+        Returns
+        -------
+        int
+
+        """
+        return compiler.opaque(self, scope)
+
 
 class ValueLoss(Loss):
     """
@@ -241,6 +282,9 @@ class ValueLoss(Loss):
     def _get_eval(self, x_dict={}, **kwargs):
         return self.loss1, x_dict
 
+    def _plan(self, compiler, scope):
+        return compiler.constant(self.loss1)
+
     @property
     def _symbol(self):
         return self.loss1
@@ -270,8 +314,12 @@ class Parameter(Loss):
     def _get_eval(self, x_dict={}, **kwargs):
         return x_dict[self._input_var[0]], x_dict
 
+    def _plan(self, compiler, scope):
+        return compiler.lookup(scope, self._input_var[0])
+
     @property
     def _symbol(self):
+        import sympy
         return sympy.Symbol(self._input_var[0])
 
 
@@ -345,6 +393,9 @@ class AddLoss(LossOperator):
         loss1, loss2, x_dict = super()._get_eval(x_dict, **kwargs)
         return loss1 + loss2, x_dict
 
+    def _plan(self, compiler, scope):
+        return compiler.apply(operator.add, [self.loss1, self.loss2], scope)
+
 
 class SubLoss(LossOperator):
     """
@@ -376,6 +427,9 @@ class SubLoss(LossOperator):
         loss1, loss2, x_dict = super()._get_eval(x_dict, **kwargs)
         return loss1 - loss2, x_dict
 
+    def _plan(self, compiler, scope):
+        return compiler.apply(operator.sub, [self.loss1, self.loss2], scope)
+
 
 class MulLoss(LossOperator):
     """
@@ -401,6 +455,9 @@ class MulLoss(LossOperator):
         loss1, loss2, x_dict = super()._get_eval(x_dict, **kwargs)
         return loss1 * loss2, x_dict
 
+    def _plan(self, compiler, scope):
+        return compiler.apply(operator.mul, [self.loss1, self.loss2], scope)
+
 
 class DivLoss(LossOperator):
     """
@@ -433,6 +490,9 @@ class DivLoss(LossOperator):
         loss1, loss2, x_dict = super()._get_eval(x_dict, **kwargs)
         return loss1 / loss2, x_dict
 
+    def _plan(self, compiler, scope):
+        return compiler.apply(operator.truediv, [self.loss1, self.loss2], scope)
+
 
 class LossSelfOperator(Loss):
     def __init__(self, loss1):
@@ -481,6 +541,9 @@ class NegLoss(LossSelfOperator):
         loss, x_dict = self.loss1._get_eval(x_dict, **kwargs)
         return -loss, x_dict
 
+    def _plan(self, compiler, scope):
+        return compiler.apply(operator.neg, [self.loss1], scope)
+
 
 class AbsLoss(LossSelfOperator):
     """
@@ -504,12 +567,16 @@ class AbsLoss(LossSelfOperator):
     """
     @property
     def _symbol(self):
+        import sympy
         return sympy.Symbol("|{}|".format(self.loss1.loss_text))
 
     def _get_eval(self, x_dict={}, **kwargs):
         loss, x_dict = self.loss1._get_eval(x_dict, **kwargs)
         return loss.abs(), x_dict
 
+    def _plan(self, compiler, scope):
+        return compiler.apply(torch.abs, [self.loss1], scope)
+
 
 class BatchMean(LossSelfOperator):
     r"""
@@ -539,12 +606,16 @@ class BatchMean(LossSelfOperator):
 
     @property
     def _symbol(self):
+        import sympy
         return sympy.Symbol("mean \\left({} \\right)".format(self.loss1.loss_text))  # TODO: fix it
 
     def _get_eval(self, x_dict={}, **kwargs):
         loss, x_dict = self.loss1._get_eval(x_dict, **kwargs)
         return loss.mean(), x_dict
 
+    def _plan(self, compiler, scope):
+        return compiler.apply(torch.mean, [self.loss1], scope)
+
 
 class BatchSum(LossSelfOperator):
     r"""
@@ -574,12 +645,16 @@ class BatchSum(LossSelfOperator):
 
     @property
     def _symbol(self):
+        import sympy
         return sympy.Symbol("sum \\left({} \\right)".format(self.loss1.loss_text))  # TODO: fix it
 
     def _get_eval(self, x_dict={}, **kwargs):
         loss, x_dict = self.loss1._get_eval(x_dict, **kwargs)
         return loss.sum(), x_dict
 
+    def _plan(self, compiler, scope):
+        return compiler.apply(torch.sum, [self.loss1], scope)
+
 
 class SetLoss(Loss):
     def __init__(self, loss):
@@ -592,6 +667,9 @@ class SetLoss(Loss):
     def _get_eval(self, x_dict, **kwargs):
         return self.loss._get_eval(x_dict, **kwargs)
 
+    def _plan(self, compiler, scope):
+        return self.loss._plan(compiler, scope)
+
     @property
     def _symbol(self):
         return self.loss._symbol
@@ -632,24 +710,56 @@ class Expectation(Loss):
     >>> loss = loss_cls.eval({"x": sample_x})
     >>> print(loss) # doctest: +SKIP
 
+    When :attr:`vectorized` is True, all samples are drawn by a single call of :meth:`sample` with
+    :attr:`sample_shape`, and :math:`f` is evaluated once on a batch of the size :math:`L \times N`.
+
+    >>> loss_cls = LogProb(p).expectation(q, sample_shape=(5,), vectorized=True)
+    >>> loss = loss_cls.eval({"x": sample_x})
+    >>> loss.shape
+    torch.Size([2])
+
+    When :attr:`target_var` is given and :math:`p` is a product of distributions, only the factors of these
+    variables and their ancestors are sampled. Then, the other variables of :math:`p` are not contained in
+    the returned samples. Note that :meth:`compile` skips unnecessary factors automatically.
+
+    >>> a = Normal(loc="x", scale=torch.tensor(1.), var=["a"], cond_var=["x"], features_shape=[10]) # q(a|x)
+    >>> loss_cls = LogProb(p).expectation(q * a, target_var=["z"])
+    >>> loss, samples = loss_cls.eval({"x": sample_x}, return_dict=True)
+    >>> sorted(samples.keys())
+    ['x', 'z']
+
     """
 
-    def __init__(self, p, f, input_var=None, sample_shape=torch.Size([1])):
+    def __init__(self, p, f, input_var=None, sample_shape=torch.Size([1]), vectorized=False, target_var=None):
+        from ..distributions.distributions import MultiplyDistribution
+
+        self._sample_kwargs = {}
+        p_input_var = p.input_var
+        if target_var is not None and isinstance(p, MultiplyDistribution):
+            self._sample_kwargs["target_var"] = target_var
+            p_input_var = p._get_required_factors(target_var)[1]
 
         if input_var is None:
-            input_var = list(set(p.input_var) | set(f.input_var) - set(p.var))
+            input_var = list(set(p_input_var) | set(f.input_var) - set(p.var))
         self._f = f
         self.sample_shape = torch.Size(sample_shape)
+        self.vectorized = vectorized
+        self.target_var = target_var
 
         super().__init__(p, input_var=input_var)
 
     @property
     def _symbol(self):
+        import sympy
         p_text = "{" + self.p.prob_text + "}"
         return sympy.Symbol("\\mathbb{{E}}_{} \\left[{} \\right]".format(p_text, self._f.loss_text))
 
     def _get_eval(self, x_dict={}, **kwargs):
-        samples_dicts = [self.p.sample(x_dict, reparam=True, return_all=True) for i in range(self.sample_shape.numel())]
+        if self.vectorized:
+            return self._get_vectorized_eval(x_dict, **kwargs)
+
+        samples_dicts = [self.p.sample(x_dict, reparam=True, return_all=True, **self._sample_kwargs)
+                         for i in range(self.sample_shape.numel())]
 
         loss_and_dicts = [self._f.eval(samples_dict, return_dict=True, **kwargs) for
                           samples_dict in samples_dicts]  # TODO: eval or _get_eval
@@ -659,3 +769,58 @@ class Expectation(Loss):
         samples_dicts[0].update(loss_and_dicts[0][1])
 
         return loss, samples_dicts[0]
+
+    def _plan(self, compiler, scope):
+        if self.vectorized or self.sample_shape.numel() != 1:
+            return super()._plan(compiler, scope)
+
+        scope = compiler.sample(self.p, scope, reparam=True)
+        return compiler.loss(self._f, scope)
+
+    def _get_vectorized_eval(self, x_dict={}, **kwargs):
+        n_sample = self.sample_shape.numel()
+        sample_dim = len(self.sample_shape)
+
+        # sampled variables: (sample_shape, n_batch, ...), the others: (n_batch, ...)
+        samples_dict = self.p.sample(x_dict, sample_shape=self.sample_shape, reparam=True, return_all=True,
+                                     **self._sample_kwargs)
+
+        batch_shapes = {}
+        for key, value in samples_dict.items():
+            if isinstance(value, torch.Tensor) and value.dim() > 0:
+                batch_dim = sample_dim if key in self.p.var else 0
+                if batch_dim > 0 and value.shape[:sample_dim] != self.sample_shape:
+                    raise ValueError("{} does not support sampling with sample_shape, "
+                                     "so the vectorized expectation cannot be used.".format(self.p.prob_text))
+                batch_shapes[key] = (batch_dim, value.shape[batch_dim])
+        n_batch = max([batch_n for _, batch_n in batch_shapes.values()], default=1)
+
+        # fold sample_shape into the batch axis (n_sample * n_batch, ...).
+        # The inputs are broadcast to sample_shape by expand views instead of copying them per sample.
+        folded_dict = dict(samples_dict)
+        for key, (batch_dim, batch_n) in batch_shapes.items():
+            value = samples_dict[key]
+            if batch_dim == 0:
+                value = value.expand(self.sample_shape + value.shape)
+            feature_shape = value.shape[sample_dim + 1:]
+            value = value.expand(self.sample_shape + torch.Size([n_batch]) + feature_shape)
+            folded_dict[key] = value.reshape(torch.Size([n_sample * n_batch]) + feature_shape)
+
+        loss, loss_sample_dict = self._f.eval(folded_dict, return_dict=True, **kwargs)
+
+        if loss.dim() == 0 or loss.shape[0] != n_sample * n_batch:
+            raise ValueError("The vectorized expectation requires the loss to keep the batch axis, "
+                             "got the shape of %s." % (loss.shape,))
+
+        # average over sample_shape
+        loss = loss.reshape(torch.Size([n_sample, n_batch]) + loss.shape[1:]).mean(dim=0)
+
+        # return the first sample, as well as the non-vectorized version.
+        for key, value in loss_sample_dict.items():
+            if key in samples_dict and key not in self.p.var:
+                continue
+            if isinstance(value, torch.Tensor) and value.dim() > 0 and value.shape[0] == n_sample * n_batch:
+                value = value[:n_batch]
+            samples_dict[key] = value
+
+        return loss, samples_dict
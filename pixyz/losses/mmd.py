@@ -1,5 +1,4 @@
 import torch
-import sympy
 from .losses import Loss
 from ..utils import get_dict_values
 
@@ -59,6 +58,7 @@ class MMD(Loss):
 
     @property
     def _symbol(self):
+        import sympy
         return sympy.Symbol("D_{{MMD^2}} \\left[{}||{} \\right]".format(self.p.prob_text, self.q.prob_text))
 
     def _get_batch_n(self, x_dict):
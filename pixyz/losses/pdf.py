@@ -1,4 +1,3 @@
-import sympy
 import torch
 from .losses import Loss
 
@@ -35,12 +34,16 @@ class LogProb(Loss):
 
     @property
     def _symbol(self):
+        import sympy
         return sympy.Symbol("\\log {}".format(self.p.prob_text))
 
     def _get_eval(self, x={}, **kwargs):
         log_prob = self.p.get_log_prob(x, sum_features=self.sum_features, feature_dims=self.feature_dims)
         return log_prob, x
 
+    def _plan(self, compiler, scope):
+        return compiler.log_prob(self.p, scope, sum_features=self.sum_features, feature_dims=self.feature_dims)
+
 
 class Prob(LogProb):
     r"""
@@ -67,8 +70,13 @@ class Prob(LogProb):
 
     @property
     def _symbol(self):
+        import sympy
         return sympy.Symbol(self.p.prob_text)
 
     def _get_eval(self, x={}, **kwargs):
         log_prob, x = super()._get_eval(x, **kwargs)
         return torch.exp(log_prob), x
+
+    def _plan(self, compiler, scope):
+        log_prob = super()._plan(compiler, scope)
+        return compiler.add((torch.exp, log_prob), lambda ctx, log_prob: torch.exp(log_prob), (log_prob,))
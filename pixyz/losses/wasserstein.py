@@ -1,5 +1,4 @@
 from torch.nn.modules.distance import PairwiseDistance
-import sympy
 from .losses import Loss
 from ..utils import get_dict_values
 
@@ -57,6 +56,7 @@ class WassersteinDistance(Loss):
 
     @property
     def _symbol(self):
+        import sympy
         return sympy.Symbol("W^{{upper}} \\left({}, {} \\right)".format(self.p.prob_text, self.q.prob_text))
 
     def _get_batch_n(self, x_dict):
@@ -18,7 +18,8 @@ class GAN(Model):
                  d_optimizer=optim.Adam,
                  d_optimizer_params={},
                  clip_grad_norm=None,
-                 clip_grad_value=None):
+                 clip_grad_value=None,
+                 cache_params=False):
         """
         Parameters
         ----------
@@ -34,6 +35,8 @@ class GAN(Model):
             Maximum allowed norm of the gradients.
         clip_grad_value : float or int
             Maximum allowed value of the gradients.
+        cache_params : bool, defaults to False
+            Whether to memoize parameters of distributions within each training/test step.
         """
 
         # set distributions (for training)
@@ -47,7 +50,8 @@ class GAN(Model):
         super().__init__(loss, test_loss=loss,
                          distributions=distributions,
                          optimizer=optimizer, optimizer_params=optimizer_params,
-                         clip_grad_norm=clip_grad_norm, clip_grad_value=clip_grad_value)
+                         clip_grad_norm=clip_grad_norm, clip_grad_value=clip_grad_value,
+                         cache_params=cache_params)
 
     def train(self, train_x_dict={}, adversarial_loss=True, **kwargs):
         """Train the model.
@@ -15,7 +15,8 @@ class ML(Model):
                  optimizer=optim.Adam,
                  optimizer_params={},
                  clip_grad_norm=False,
-                 clip_grad_value=False):
+                 clip_grad_value=False,
+                 cache_params=False):
         """
         Parameters
         ----------
@@ -29,6 +30,8 @@ class ML(Model):
             Maximum allowed norm of the gradients.
         clip_grad_value : float or int
             Maximum allowed value of the gradients.
+        cache_params : bool, defaults to False
+            Whether to memoize parameters of distributions within each training/test step.
         """
 
         # set distributions (for training)
@@ -41,7 +44,8 @@ class ML(Model):
         super().__init__(loss, test_loss=loss,
                          distributions=distributions,
                          optimizer=optimizer, optimizer_params=optimizer_params,
-                         clip_grad_norm=clip_grad_norm, clip_grad_value=clip_grad_value)
+                         clip_grad_norm=clip_grad_norm, clip_grad_value=clip_grad_value,
+                         cache_params=cache_params)
 
     def train(self, train_x_dict={}, **kwargs):
         return super().train(train_x_dict, **kwargs)
@@ -3,7 +3,7 @@ import torch
 from torch.nn.utils import clip_grad_norm_, clip_grad_value_
 import re
 
-from ..utils import tolist
+from ..utils import tolist, cache_scope
 from ..distributions.distributions import Distribution
 
 
@@ -64,7 +64,8 @@ class Model(object):
                  optimizer=optim.Adam,
                  optimizer_params={},
                  clip_grad_norm=None,
-                 clip_grad_value=None):
+                 clip_grad_value=None,
+                 cache_params=False):
         """
         Parameters
         ----------
@@ -82,6 +83,10 @@ class Model(object):
             Maximum allowed norm of the gradients.
         clip_grad_value : float or int
             Maximum allowed value of the gradients.
+        cache_params : bool, defaults to False
+            Whether to memoize parameters of distributions within each call of :meth:`train` and :meth:`test`
+            (see :class:`pixyz.utils.cache_scope`). This is also required to share outputs of
+            :class:`pixyz.distributions.Deterministic` among distributions within each step.
         """
 
         # set losses
@@ -98,6 +103,7 @@ class Model(object):
 
         self.clip_norm = clip_grad_norm
         self.clip_value = clip_grad_value
+        self.cache_params = cache_params
 
     def __str__(self):
         prob_text = []
@@ -143,10 +149,11 @@ class Model(object):
         self.distributions.train()
 
         self.optimizer.zero_grad()
-        loss = self.loss_cls.eval(train_x_dict, **kwargs)
+        with cache_scope(enabled=self.cache_params):
+            loss = self.loss_cls.eval(train_x_dict, **kwargs)
 
-        # backprop
-        loss.backward()
+            # backprop
+            loss.backward()
 
         if self.clip_norm:
             clip_grad_norm_(self.distributions.parameters(), self.clip_norm)
@@ -175,7 +182,7 @@ class Model(object):
         """
         self.distributions.eval()
 
-        with torch.no_grad():
+        with torch.no_grad(), cache_scope(enabled=self.cache_params):
             loss = self.test_loss_cls.eval(test_x_dict, **kwargs)
 
         return loss
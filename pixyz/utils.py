@@ -1,9 +1,13 @@
+import functools
+import threading
+from concurrent.futures import ThreadPoolExecutor
 import torch
-import sympy
-from IPython.display import Math
 import pixyz
 
 _EPSILON = 1e-07
+_FAST_DISTRIBUTIONS = False
+_VALIDATE_ARGS = None
+_PARALLEL_BRANCHES = 0
 
 
 def set_epsilon(eps):
@@ -45,6 +49,397 @@ def epsilon():
     return _EPSILON
 
 
+def set_fast_distributions(enabled):
+    """Set whether to use lightweight implementations of distributions.
+
+    If True, :class:`pixyz.distributions.Normal`, :class:`pixyz.distributions.Bernoulli`,
+    :class:`pixyz.distributions.Categorical` and :class:`pixyz.distributions.Laplace` compute
+    log-likelihoods, samples and entropies directly from their parameters by the classes in
+    :mod:`pixyz.distributions.fast_distributions`, instead of :mod:`torch.distributions`.
+
+    Parameters
+    ----------
+    enabled : bool
+
+    Examples
+    --------
+    >>> from unittest import mock
+    >>> with mock.patch('pixyz.utils._FAST_DISTRIBUTIONS', False):
+    ...     set_fast_distributions(True)
+    ...     fast_distributions()
+    True
+    """
+    global _FAST_DISTRIBUTIONS
+    _FAST_DISTRIBUTIONS = enabled
+
+
+def fast_distributions():
+    """Get whether to use lightweight implementations of distributions.
+
+    Returns
+    -------
+    bool
+
+    Examples
+    --------
+    >>> from unittest import mock
+    >>> with mock.patch('pixyz.utils._FAST_DISTRIBUTIONS', False):
+    ...     fast_distributions()
+    False
+    """
+    return _FAST_DISTRIBUTIONS
+
+
+def set_validate_args(validate_args):
+    """Set whether to validate arguments of PyTorch distributions set by :meth:`set_dist`.
+
+    Parameters
+    ----------
+    validate_args : bool or NoneType
+        If None, the default of :mod:`torch.distributions` is used.
+        Lightweight distributions are validated only if it is True.
+
+    Examples
+    --------
+    >>> from unittest import mock
+    >>> with mock.patch('pixyz.utils._VALIDATE_ARGS', None):
+    ...     set_validate_args(False)
+    ...     validate_args()
+    False
+    """
+    global _VALIDATE_ARGS
+    _VALIDATE_ARGS = validate_args
+
+
+def validate_args():
+    """Get whether to validate arguments of PyTorch distributions set by :meth:`set_dist`.
+
+    Returns
+    -------
+    bool or NoneType
+
+    Examples
+    --------
+    >>> from unittest import mock
+    >>> with mock.patch('pixyz.utils._VALIDATE_ARGS', None):
+    ...     validate_args() is None
+    True
+    """
+    return _VALIDATE_ARGS
+
+
+def set_parallel_branches(n_workers):
+    """Set the number of threads to evaluate independent factors of distributions concurrently.
+
+    If it is larger than 1, :meth:`pixyz.distributions.distributions.MultiplyDistribution.sample` and
+    :meth:`pixyz.distributions.distributions.MultiplyDistribution.get_log_prob` dispatch factors which do not
+    depend on each other (e.g., :math:`p(x|z)` and :math:`p(y|z)` in :math:`p(x|z)p(y|z)`) to a thread pool,
+    and the intra-op threads of PyTorch are divided among the concurrent factors.
+    The results are merged in the order of factors, but the order of random draws among concurrent factors
+    is not deterministic, so samples are not reproducible by seeding.
+    This is disabled by default: the thread pool adds overhead to each call, and whether it pays off depends
+    on the number of cores and the size of the factors (measure it by `benchmarks/parallel_branches.py`).
+
+    Parameters
+    ----------
+    n_workers : int
+        Number of threads. If it is 0 or 1, factors are evaluated sequentially.
+
+    Examples
+    --------
+    >>> from unittest import mock
+    >>> with mock.patch('pixyz.utils._PARALLEL_BRANCHES', 0):
+    ...     set_parallel_branches(4)
+    ...     parallel_branches()
+    4
+    """
+    global _PARALLEL_BRANCHES, _THREAD_POOL
+    if _THREAD_POOL is not None:
+        _THREAD_POOL.shutdown(wait=False)
+        _THREAD_POOL = None
+    _PARALLEL_BRANCHES = n_workers
+
+
+def parallel_branches():
+    """Get the number of threads to evaluate independent factors of distributions concurrently.
+
+    Returns
+    -------
+    int
+
+    Examples
+    --------
+    >>> from unittest import mock
+    >>> with mock.patch('pixyz.utils._PARALLEL_BRANCHES', 0):
+    ...     parallel_branches()
+    0
+    """
+    return _PARALLEL_BRANCHES
+
+
+_THREAD_POOL = None
+_BRANCH_STATE = threading.local()
+
+
+def _run_branch(function, grad_enabled, inference_mode):
+    # grad mode and inference mode are thread-local, so they are inherited from the caller explicitly.
+    _BRANCH_STATE.active = True
+    try:
+        with torch.inference_mode(inference_mode), torch.set_grad_enabled(grad_enabled):
+            return function()
+    finally:
+        _BRANCH_STATE.active = False
+
+
+def map_branches(functions):
+    """Call independent functions, concurrently if :func:`parallel_branches` is larger than 1.
+
+    The functions are called sequentially if concurrency is disabled, only a single function is given,
+    or this is called from a function already dispatched to the thread pool.
+
+    Parameters
+    ----------
+    functions : :obj:`list` of function
+        Functions without any arguments.
+
+    Returns
+    -------
+    list
+        Outputs of the functions in the given order.
+
+    Examples
+    --------
+    >>> import pixyz.utils
+    >>> from unittest import mock
+    >>> with mock.patch('pixyz.utils._PARALLEL_BRANCHES', 2), mock.patch('pixyz.utils._THREAD_POOL', None):
+    ...     outputs = map_branches([lambda: torch.ones(1), lambda: torch.zeros(1)])
+    ...     pixyz.utils._THREAD_POOL.shutdown()
+    >>> outputs
+    [tensor([1.]), tensor([0.])]
+    """
+    global _THREAD_POOL
+    n_workers = min(_PARALLEL_BRANCHES, len(functions))
+    if n_workers < 2 or getattr(_BRANCH_STATE, "active", False):
+        return [function() for function in functions]
+
+    if _THREAD_POOL is None:
+        _THREAD_POOL = ThreadPoolExecutor(max_workers=_PARALLEL_BRANCHES, thread_name_prefix="pixyz")
+
+    # divide intra-op threads among concurrent functions so that they do not oversubscribe cores.
+    # the number of threads is shared by all threads, so it is restored after all functions are finished.
+    n_threads = torch.get_num_threads()
+    torch.set_num_threads(max(1, n_threads // n_workers))
+    try:
+        futures = [_THREAD_POOL.submit(_run_branch, function, torch.is_grad_enabled(),
+                                       torch.is_inference_mode_enabled()) for function in functions]
+        return [future.result() for future in futures]
+    finally:
+        torch.set_num_threads(n_threads)
+
+
+class cache_scope(object):
+    """Memoize parameters of distributions within this scope.
+
+    While the scope is active, :meth:`pixyz.distributions.distributions.DistributionBase.get_params` and
+    :meth:`pixyz.distributions.Deterministic.sample` reuse the output of :meth:`forward` when they are called
+    again with the same inputs.
+    The inputs are identified by the identity and the version counter (`_version`) of tensors,
+    so the cache is invalidated when the inputs are replaced or modified in-place.
+    All cached values are released when exiting the scope.
+    The scope is shared with the functions dispatched by :func:`map_branches`, so it is guarded by a lock.
+
+    Parameters
+    ----------
+    enabled : bool, defaults to True
+        Whether to enable the cache. If False, an outer scope is also disabled inside this scope.
+
+    Examples
+    --------
+    >>> from pixyz.distributions import Normal
+    >>> p = Normal(loc="x", scale=torch.tensor(1.), var=["z"], cond_var=["x"], features_shape=[2])
+    >>> x = torch.zeros(1, 2)
+    >>> with cache_scope() as cache:
+    ...     params_1 = p.get_params({"x": x})
+    ...     params_2 = p.get_params({"x": x})
+    ...     x += 1  # in-place modification invalidates the cache
+    ...     params_3 = p.get_params({"x": x})
+    >>> params_1["loc"] is params_2["loc"]
+    True
+    >>> cache.hits, cache.misses
+    (1, 2)
+    """
+
+    def __init__(self, enabled=True):
+        self.enabled = enabled
+        self.hits = 0
+        self.misses = 0
+        self._cache = {}
+        self._lock = threading.Lock()
+
+    def __enter__(self):
+        _CACHE_SCOPES.append(self)
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        _CACHE_SCOPES.remove(self)
+        self._cache.clear()
+
+    @staticmethod
+    def _get_token(value):
+        if isinstance(value, torch.Tensor):
+            return id(value), value._version
+        try:
+            hash(value)
+        except TypeError:
+            return id(value)
+        return value
+
+    def memoize(self, owner, inputs_dict, function):
+        """Return the cached output of `function` for `owner` given `inputs_dict`, or call it.
+
+        Parameters
+        ----------
+        owner : torch.nn.Module
+            Module which computes the output.
+        inputs_dict : dict
+            Inputs of `function`.
+        function : function
+            Function which computes the output without any arguments.
+
+        Returns
+        -------
+        dict
+
+        """
+        key = (id(owner), owner.training, torch.is_grad_enabled()) + \
+            tuple((k, self._get_token(v)) for k, v in sorted(inputs_dict.items(), key=lambda item: item[0]))
+
+        with self._lock:
+            if key in self._cache:
+                self.hits += 1
+                return dict(self._cache[key][-1])
+            self.misses += 1
+
+        # the lock is not held while computing, so that concurrent branches are not serialized.
+        outputs = function()
+        with self._lock:
+            # keep references of the owner and the inputs so that their ids are not reused within this scope.
+            # if another branch has stored the output meanwhile, it is shared.
+            outputs = self._cache.setdefault(key, (owner, list(inputs_dict.values()), outputs))[-1]
+        return dict(outputs)
+
+
+_CACHE_SCOPES = []
+
+
+def get_cache_scope():
+    """Get the innermost active :class:`cache_scope`.
+
+    Returns
+    -------
+    cache_scope or NoneType
+        None if no scope is active or the innermost scope is disabled.
+
+    Examples
+    --------
+    >>> get_cache_scope() is None
+    True
+    >>> with cache_scope() as cache:
+    ...     get_cache_scope() is cache
+    True
+    """
+    if len(_CACHE_SCOPES) == 0 or not _CACHE_SCOPES[-1].enabled:
+        return None
+    return _CACHE_SCOPES[-1]
+
+
+class SampleDict(dict):
+    """Dictionary of variables and their (batched) samples.
+
+    This is a subclass of :obj:`dict`, so it can be used everywhere :attr:`x_dict` is accepted.
+    Samples and inputs of distributions are returned as this class.
+    In addition to the methods of :obj:`dict`, it supports whole-batch operations over all tensors.
+
+    Examples
+    --------
+    >>> x_dict = SampleDict({"x": torch.zeros(4, 2), "y": torch.ones(4), "n": 3})
+    >>> x_dict["x"].shape
+    torch.Size([4, 2])
+    >>> chunk = x_dict[:2]  # index tensors along the batch axis
+    >>> chunk["x"].shape, chunk["y"].shape, chunk["n"]
+    (torch.Size([2, 2]), torch.Size([2]), 3)
+    >>> x_dict.rename({"x": "z"})["z"] is x_dict["x"]
+    True
+    >>> x_dict.select(["y"])
+    {'y': tensor([1., 1., 1., 1.])}
+    >>> x_dict.to(torch.float64)["x"].dtype
+    torch.float64
+    >>> type(x_dict.copy()).__name__
+    'SampleDict'
+    """
+
+    def __getitem__(self, key):
+        if isinstance(key, (slice, int)):
+            return self._apply(lambda value: value[key] if value.dim() > 0 else value)
+        return super().__getitem__(key)
+
+    def _apply(self, function):
+        return SampleDict((key, function(value)) if isinstance(value, torch.Tensor) else (key, value)
+                          for key, value in self.items())
+
+    def copy(self):
+        """Return a shallow copy, in which samples are not copied."""
+        return SampleDict(self)
+
+    def to(self, *args, **kwargs):
+        """Apply :meth:`torch.Tensor.to` to all tensors.
+
+        Returns
+        -------
+        SampleDict
+
+        """
+        return self._apply(lambda value: value.to(*args, **kwargs))
+
+    def detach(self):
+        """Detach all tensors.
+
+        Returns
+        -------
+        SampleDict
+
+        """
+        return self._apply(lambda value: value.detach())
+
+    def select(self, keys):
+        """Return the variables specified by `keys`, ignoring keys which are not contained.
+
+        Parameters
+        ----------
+        keys : list
+
+        Returns
+        -------
+        SampleDict
+
+        """
+        return SampleDict((key, dict.__getitem__(self, key)) for key in keys if key in self)
+
+    def rename(self, replace_dict):
+        """Return the variables renamed according to `replace_dict`. Samples are shared, not copied.
+
+        Parameters
+        ----------
+        replace_dict : dict
+
+        Returns
+        -------
+        SampleDict
+
+        """
+        return SampleDict((replace_dict.get(key, key), value) for key, value in self.items())
+
+
 def get_dict_values(dicts, keys, return_dict=False):
     """Get values from `dicts` specified by `keys`.
 
@@ -69,11 +464,12 @@ def get_dict_values(dicts, keys, return_dict=False):
     >>> get_dict_values({"a":1,"b":2,"c":3}, ["b", "d"], True)
     {'b': 2}
     """
-    new_dicts = dict((key, dicts[key]) for key in keys if key in list(dicts.keys()))
     if return_dict is False:
-        return list(new_dicts.values())
+        return [dicts[key] for key in keys if key in dicts]
 
-    return new_dicts
+    if isinstance(dicts, SampleDict):
+        return dicts.select(keys)
+    return dict((key, dicts[key]) for key in keys if key in dicts)
 
 
 def delete_dict_values(dicts, keys):
@@ -94,7 +490,10 @@ def delete_dict_values(dicts, keys):
     >>> delete_dict_values({"a":1,"b":2,"c":3}, ["b","d"])
     {'a': 1, 'c': 3}
     """
+    keys = set(keys)
     new_dicts = dict((key, value) for key, value in dicts.items() if key not in keys)
+    if isinstance(dicts, SampleDict):
+        return SampleDict(new_dicts)
     return new_dicts
 
 
@@ -109,6 +508,8 @@ def detach_dict(dicts):
     -------
     dict
     """
+    if isinstance(dicts, SampleDict):
+        return dicts.detach()
     return {k: v.detach() for k, v in dicts.items()}
 
 
@@ -134,10 +535,9 @@ def replace_dict_keys(dicts, replace_list_dict):
     >>> replace_dict_keys({"a":1,"b":2,"c":3}, {"a":"x","e":"y"})  # keys of `replace_list_dict`
     {'x': 1, 'b': 2, 'c': 3}
     """
-    replaced_dicts = dict([(replace_list_dict[key], value) if key in list(replace_list_dict.keys())
-                           else (key, value) for key, value in dicts.items()])
-
-    return replaced_dicts
+    if isinstance(dicts, SampleDict):
+        return dicts.rename(replace_list_dict)
+    return dict((replace_list_dict.get(key, key), value) for key, value in dicts.items())
 
 
 def replace_dict_keys_split(dicts, replace_list_dict):
@@ -167,11 +567,13 @@ def replace_dict_keys_split(dicts, replace_list_dict):
     ({'loc': 0}, {'b': 1})
 
     """
-    replaced_dict = {replace_list_dict[key]: value for key, value in dicts.items()
-                     if key in list(replace_list_dict.keys())}
-
-    remain_dict = {key: value for key, value in dicts.items()
-                   if key not in list(replace_list_dict.keys())}
+    replaced_dict = {}
+    remain_dict = {}
+    for key, value in dicts.items():
+        if key in replace_list_dict:
+            replaced_dict[replace_list_dict[key]] = value
+        else:
+            remain_dict[key] = value
 
     return replaced_dict, remain_dict
 
@@ -201,18 +603,20 @@ def tolist(a):
     return [a]
 
 
-def sum_samples(samples):
+def sum_samples(samples, sum_dims=None):
     """Sum a given sample across the axes.
 
     Parameters
     ----------
     samples : torch.Tensor
-        Input sample. The number of this axes is assumed to be 4 or less.
+        Input sample.
+    sum_dims : :obj:`int`, :obj:`tuple` of :obj:`int` or :obj:`NoneType`, defaults to None
+        Axes to sum across. If None, all axes except the first axis are summed.
 
     Returns
     -------
     torch.Tensor
-        Sum over all axes except the first axis.
+        Sum over `sum_dims`.
 
 
     Examples
@@ -226,17 +630,21 @@ def sum_samples(samples):
     >>> a = torch.ones([2, 3, 4])
     >>> sum_samples(a).size()
     torch.Size([2])
+    >>> a = torch.ones([2, 3, 4, 5, 6, 7])
+    >>> sum_samples(a).size()
+    torch.Size([2])
+    >>> sum_samples(a, sum_dims=(-3, -2, -1)).size()
+    torch.Size([2, 3, 4])
     """
 
-    dim = samples.dim()
-    if dim == 1:
-        return samples
-    elif dim <= 4:
-        dim_list = list(torch.arange(samples.dim()))
-        samples = torch.sum(samples, dim=dim_list[1:])
+    if sum_dims is None:
+        sum_dims = tuple(range(1, samples.dim()))
+    elif isinstance(sum_dims, int):
+        sum_dims = (sum_dims,)
+
+    if len(sum_dims) == 0:
         return samples
-    raise ValueError("The number of sample axes must be any of 1, 2, 3, or 4, "
-                     "got %s." % dim)
+    return torch.sum(samples, dim=tuple(sum_dims))
 
 
 def print_latex(obj):
@@ -247,6 +655,7 @@ def print_latex(obj):
     obj : pixyz.distributions.distributions.Distribution, pixyz.losses.losses.Loss or pixyz.models.model.Model.
 
     """
+    from IPython.display import Math
 
     if isinstance(obj, pixyz.distributions.distributions.Distribution):
         latex_text = obj.prob_joint_factorized_and_text
@@ -258,5 +667,22 @@ def print_latex(obj):
     return Math(latex_text)
 
 
+@functools.lru_cache(maxsize=None)
 def convert_latex_name(name):
+    """Convert a name of a variable or a distribution to the latex format. The results are cached.
+
+    Parameters
+    ----------
+    name : str
+
+    Returns
+    -------
+    str
+
+    Examples
+    --------
+    >>> convert_latex_name("z_1")
+    'z_{1}'
+    """
+    import sympy
     return sympy.latex(sympy.Symbol(name))
@@ -36,7 +36,7 @@ setup(
     long_description=long_description,
     long_description_content_type="text/markdown",
     install_requires=[
-        "torch>=1.0",
+        "torch>=1.12",
         "torchvision",
         "tqdm",
         "scipy",